@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Persistent cache of post-processed assimp imports.
+
+Scenes are stored as one directory per (source content hash, assimp flags)
+holding a json manifest and memory-mappable .npy blobs, so a warm start
+never goes through assimp nor through the python attribute preparation.
+
+Pre-warm the whole resource tree with:  python assetcache.py ../resources
+"""
+import os
+import json
+import shutil
+import tempfile
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import assimpcy
+import numpy as np
+
+from diskcache import CACHE_DIR, file_hash
+from skinning import MAX_BONES, pack_bone_weights
+
+CACHE_VERSION = 2
+
+_pp = assimpcy.aiPostProcessSteps
+PHONG_FLAGS = _pp.aiProcess_Triangulate | _pp.aiProcess_FlipUVs
+SKINNED_FLAGS = _pp.aiProcess_Triangulate | _pp.aiProcess_GenSmoothNormals
+
+KEY_KINDS = ('position', 'rotation', 'scaling')
+MESH_ARRAYS = ('vertices', 'uvs', 'normals', 'faces', 'bone_ids', 'bone_weights', 'bone_offsets')
+
+
+# ------------  CPU side scene description, as found in the cache -----------
+class MeshData:
+    """ Vertex attributes, faces and skinning data of one imported mesh """
+
+    def __init__(self, vertices, uvs, normals, faces, material,
+                 bone_ids=None, bone_weights=None, bone_names=(), bone_offsets=None):
+        self.vertices = vertices
+        self.uvs = uvs
+        self.normals = normals
+        self.faces = faces
+        self.material = material
+        self.bone_ids = bone_ids
+        self.bone_weights = bone_weights
+        self.bone_names = list(bone_names)
+        self.bone_offsets = bone_offsets
+
+
+class NodeData:
+    """ One node of the imported hierarchy """
+
+    def __init__(self, name, transform, meshes=(), children=()):
+        self.name = name
+        self.transform = transform
+        self.meshes = list(meshes)
+        self.children = list(children)
+
+
+class SceneData:
+    """ Whole imported file: meshes, material textures, nodes and keyframes.
+        'textures' holds the TEXTURE_BASE name of each material (or None),
+        'channels' maps node names to ((times, values),) * 3 for the
+        position, rotation and scaling keys, times being in seconds. """
+
+    def __init__(self, meshes, textures, root, channels):
+        self.meshes = meshes
+        self.textures = textures
+        self.root = root
+        self.channels = channels
+
+
+# ------------  assimp import -----------------------------------------------
+def _name(name):
+    return name.decode() if isinstance(name, bytes) else name
+
+
+def _pack_bones(mesh):
+    """ flatten assimp bone weights to triples, then keep the strongest """
+    bones = mesh.mBones[:MAX_BONES]
+    count = sum(len(bone.mWeights) for bone in bones)
+    vertex_ids = np.fromiter((entry.mVertexId for bone in bones for entry in bone.mWeights), np.int64, count)
+    bone_ids = np.repeat(np.arange(len(bones)), [len(bone.mWeights) for bone in bones])
+    weights = np.fromiter((entry.mWeight for bone in bones for entry in bone.mWeights), np.float32, count)
+    return pack_bone_weights(vertex_ids, bone_ids, weights, mesh.mNumVertices)
+
+
+def import_scene(file, flags):
+    """ import file with assimp and convert it to a SceneData """
+    scene = assimpcy.aiImportFile(file, flags)
+
+    textures = [_name(mat.properties['TEXTURE_BASE']) if 'TEXTURE_BASE' in mat.properties else None
+                for mat in scene.mMaterials]
+
+    meshes = []
+    for mesh in scene.mMeshes:
+        uvs = mesh.mTextureCoords[0] if len(mesh.mTextureCoords) else None
+        data = MeshData(np.asarray(mesh.mVertices, np.float32),
+                        None if uvs is None else np.asarray(uvs, np.float32),
+                        np.asarray(mesh.mNormals, np.float32),
+                        np.asarray(mesh.mFaces, np.uint32), int(mesh.mMaterialIndex))
+        if len(mesh.mBones):
+            data.bone_ids, data.bone_weights = _pack_bones(mesh)
+            data.bone_names = [_name(bone.mName) for bone in mesh.mBones]
+            data.bone_offsets = np.array([bone.mOffsetMatrix for bone in mesh.mBones], np.float32)
+        meshes.append(data)
+
+    def make_nodes(assimp_node):
+        return NodeData(_name(assimp_node.mName), np.asarray(assimp_node.mTransformation, np.float32),
+                        [int(index) for index in assimp_node.mMeshes],
+                        (make_nodes(child) for child in assimp_node.mChildren))
+
+    def conv(assimp_keys, ticks_per_second):
+        """ Conversion from assimp key struct to (times, values) arrays """
+        times = np.array([key.mTime / ticks_per_second for key in assimp_keys], np.float64)
+        return times, np.array([key.mValue for key in assimp_keys], np.float32)
+
+    channels = {}
+    if scene.mAnimations:
+        anim = scene.mAnimations[0]
+        for channel in anim.mChannels:
+            channels[_name(channel.mNodeName)] = (
+                conv(channel.mPositionKeys, anim.mTicksPerSecond),
+                conv(channel.mRotationKeys, anim.mTicksPerSecond),
+                conv(channel.mScalingKeys, anim.mTicksPerSecond)
+            )
+
+    return SceneData(meshes, textures, make_nodes(scene.mRootNode), channels)
+
+
+# ------------  on disk storage ---------------------------------------------
+def cache_path(file, flags):
+    """ cache directory of a source file imported with given assimp flags """
+    key = '%s-%x-v%d' % (file_hash(file), int(flags), CACHE_VERSION)
+    return os.path.join(CACHE_DIR, key)
+
+
+def _load(path):
+    """ memory map an .npy blob; empty arrays cannot be mapped """
+    try:
+        return np.load(path, mmap_mode='r')
+    except ValueError:
+        return np.load(path)
+
+
+def save_scene(path, scene):
+    """ write scene to cache directory path, atomically """
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=CACHE_DIR)
+
+    def save(name, array):
+        np.save(os.path.join(tmp, name + '.npy'), np.ascontiguousarray(array))
+
+    manifest = {'version': CACHE_VERSION, 'textures': scene.textures,
+                'meshes': [], 'nodes': [], 'channels': {}}
+    for index, mesh in enumerate(scene.meshes):
+        arrays = [name for name in MESH_ARRAYS if getattr(mesh, name) is not None]
+        for name in arrays:
+            save('mesh%d_%s' % (index, name), getattr(mesh, name))
+        manifest['meshes'].append({'material': mesh.material, 'arrays': arrays,
+                                   'bones': mesh.bone_names})
+
+    # flatten node hierarchy, parents always before children
+    transforms = []
+    stack = [(scene.root, -1)]
+    while stack:
+        node, parent = stack.pop()
+        manifest['nodes'].append({'name': node.name, 'parent': parent, 'meshes': node.meshes})
+        transforms.append(node.transform)
+        stack.extend((child, len(transforms) - 1) for child in reversed(node.children))
+    save('node_transforms', np.array(transforms, np.float32).reshape(-1, 4, 4))
+
+    # concatenate keys of all channels, manifest stores per channel ranges
+    keys = {kind: ([], []) for kind in KEY_KINDS}
+    for name, channel in scene.channels.items():
+        ranges = []
+        for kind, (times, values) in zip(KEY_KINDS, channel):
+            start = sum(len(t) for t in keys[kind][0])
+            keys[kind][0].append(times)
+            keys[kind][1].append(values)
+            ranges.append((start, start + len(times)))
+        manifest['channels'][name] = ranges
+    for kind, (times, values) in keys.items():
+        width = 4 if kind == 'rotation' else 3
+        save('key_%s_times' % kind, np.concatenate(times) if times else np.zeros(0))
+        save('key_%s_values' % kind, np.concatenate(values) if values else np.zeros((0, width), 'f'))
+
+    with open(os.path.join(tmp, 'manifest.json'), 'w') as stream:
+        json.dump(manifest, stream)
+
+    try:
+        os.rename(tmp, path)
+    except OSError:  # another process cached the same file meanwhile
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def read_scene(path):
+    """ rebuild a SceneData from a cache directory, arrays are memory mapped """
+    with open(os.path.join(path, 'manifest.json')) as stream:
+        manifest = json.load(stream)
+
+    def load(name):
+        return _load(os.path.join(path, name + '.npy'))
+
+    meshes = []
+    for index, entry in enumerate(manifest['meshes']):
+        arrays = {name: load('mesh%d_%s' % (index, name)) for name in entry['arrays']}
+        meshes.append(MeshData(arrays['vertices'], arrays.get('uvs'), arrays['normals'],
+                               arrays['faces'], entry['material'], arrays.get('bone_ids'),
+                               arrays.get('bone_weights'), entry['bones'], arrays.get('bone_offsets')))
+
+    transforms = load('node_transforms')
+    nodes = []
+    for entry, transform in zip(manifest['nodes'], transforms):
+        nodes.append(NodeData(entry['name'], transform, entry['meshes']))
+        if entry['parent'] >= 0:
+            nodes[entry['parent']].children.append(nodes[-1])
+
+    keys = {kind: (load('key_%s_times' % kind), load('key_%s_values' % kind)) for kind in KEY_KINDS}
+    channels = {}
+    for name, ranges in manifest['channels'].items():
+        channels[name] = tuple((keys[kind][0][start:end], keys[kind][1][start:end])
+                               for kind, (start, end) in zip(KEY_KINDS, ranges))
+
+    return SceneData(meshes, manifest['textures'], nodes[0], channels)
+
+
+def cache_scene(file, flags):
+    """ cache directory of file imported with flags, importing it there
+        first if needed, None if it cannot be read or imported """
+    try:
+        path = cache_path(file, flags)
+    except OSError as exception:
+        print('ERROR loading', file + ': ', exception.strerror)
+        return None
+    if not os.path.exists(os.path.join(path, 'manifest.json')):
+        try:
+            scene = import_scene(file, flags)
+        except assimpcy.all.AssimpError as exception:
+            print('ERROR loading', file + ': ', exception.args[0].decode())
+            return None
+        save_scene(path, scene)
+    return path
+
+
+def load_scene(file, flags, path=None):
+    """ SceneData of file, from cache when possible, None if import fails;
+        path is its cache directory when already known, see cache_scene """
+    path = path or cache_scene(file, flags)
+    return read_scene(path) if path else None
+
+
+# ------------  command line cache pre-warming ------------------------------
+def _warm(job):
+    file, flags = job
+    return file, cache_scene(file, flags) is not None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pre-warm the imported asset cache.')
+    parser.add_argument('root', nargs='?', default=os.path.join(os.pardir, 'resources'))
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count())
+    parser.add_argument('--flags', choices=('phong', 'skinned', 'both'), default='both')
+    args = parser.parse_args()
+
+    flags = {'phong': [PHONG_FLAGS], 'skinned': [SKINNED_FLAGS],
+             'both': [PHONG_FLAGS, SKINNED_FLAGS]}[args.flags]
+    files = sorted(os.path.join(d, f) for d, _, n in os.walk(args.root, followlinks=True)
+                   for f in n if f.lower().endswith('.fbx'))
+    jobs = [(file, flag) for file in files for flag in flags]
+
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        for file, ok in pool.map(_warm, jobs):
+            print('cached' if ok else 'FAILED', file)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+"""
+Block compression of RGBA images with numpy: BC1 (DXT1, opaque RGB) and
+BC3 (DXT5, RGB + interpolated alpha), for glCompressedTexImage2D upload.
+
+Encoded images are cached next to their source as '<source>.bcn' files:
+a 64 byte header of 8 little endian uint64 (magic, format, width, height,
+levels, quality, source size, source mtime) followed by the blocks of each
+mip level, largest first.
+"""
+import os
+import tempfile
+
+import numpy as np
+from OpenGL.GL.EXT.texture_compression_s3tc import (GL_COMPRESSED_RGB_S3TC_DXT1_EXT,
+                                                    GL_COMPRESSED_RGBA_S3TC_DXT5_EXT)
+
+BCN_MAGIC = 0x314e4342  # 'BCN1'
+BC1, BC3 = 1, 3
+BLOCK_BYTES = {BC1: 8, BC3: 16}
+GL_FORMATS = {BC1: GL_COMPRESSED_RGB_S3TC_DXT1_EXT, BC3: GL_COMPRESSED_RGBA_S3TC_DXT5_EXT}
+
+# 'fast': bounding box endpoints, 'best': principal axis endpoints refined
+# by a least squares fit on the chosen palette indices
+QUALITIES = ('fast', 'best')
+CHUNK_BLOCKS = 1 << 16  # blocks encoded at once, bounds temporary memory
+
+
+# ------------  Block extraction ---------------------------------------------
+def blocks(image):
+    """ (N, 16, 4) array of the 4x4 pixel blocks of a RGBA image, in row
+        major block order, borders padded by edge replication """
+    height, width = image.shape[:2]
+    padded = np.pad(image, ((0, -height % 4), (0, -width % 4), (0, 0)), mode='edge')
+    rows, cols = padded.shape[0] // 4, padded.shape[1] // 4
+    return padded.reshape(rows, 4, cols, 4, 4).swapaxes(1, 2).reshape(rows * cols, 16, 4)
+
+
+# ------------  Colour endpoints and indices ---------------------------------
+def _to565(colors):
+    """ pack (N, 3) colours in 0..255 to RGB565 """
+    r, g, b = (np.clip(np.rint(colors[:, i] * scale / 255), 0, scale).astype(np.uint32)
+               for i, scale in enumerate((31, 63, 31)))
+    return (r << 11) | (g << 5) | b
+
+
+def _from565(packed):
+    """ unpack RGB565 to (N, 3) float colours in 0..255, as a GPU would """
+    r, g, b = (packed >> 11) & 31, (packed >> 5) & 63, packed & 31
+    channels = ((r << 3) | (r >> 2), (g << 2) | (g >> 4), (b << 3) | (b >> 2))
+    return np.stack(channels, axis=1).astype(np.float32)
+
+
+def _color_palette(c0, c1):
+    """ 4 colour palette (N, 4, 3) of BC1 four colour mode """
+    p0, p1 = _from565(c0), _from565(c1)
+    return np.stack((p0, p1, (2 * p0 + p1) / 3, (p0 + 2 * p1) / 3), axis=1)
+
+
+def _color_indices(colors, palette):
+    """ nearest palette entry of each of the 16 colours of each block """
+    distances = ((colors[:, :, None, :] - palette[:, None, :, :]) ** 2).sum(axis=3)
+    return distances.argmin(axis=2).astype(np.uint32)
+
+
+def _color_endpoints(colors, quality):
+    """ (N, 3) endpoint pairs for blocks of (N, 16, 3) colours """
+    if quality == 'fast':  # inset bounding box diagonal
+        low, high = colors.min(axis=1), colors.max(axis=1)
+        inset = (high - low) / 16
+        return high - inset, low + inset
+
+    # principal axis of each block, endpoints at extreme projections
+    mean = colors.mean(axis=1, keepdims=True)
+    centered = colors - mean
+    _, vectors = np.linalg.eigh(np.einsum('nki,nkj->nij', centered, centered))
+    axis = vectors[:, :, -1]
+    projection = np.einsum('nki,ni->nk', centered, axis)
+    mean = mean[:, 0]
+    return (mean + projection.max(axis=1, keepdims=True) * axis,
+            mean + projection.min(axis=1, keepdims=True) * axis)
+
+
+def _refine(colors, indices, e0, e1):
+    """ least squares endpoints reproducing colours with fixed indices """
+    weights = np.array((1, 0, 2 / 3, 1 / 3), np.float32)[indices]  # share of e0
+    a, b = weights, 1 - weights
+    aa, bb, ab = (a * a).sum(1), (b * b).sum(1), (a * b).sum(1)
+    ax, bx = np.einsum('nk,nki->ni', a, colors), np.einsum('nk,nki->ni', b, colors)
+    det = aa * bb - ab * ab
+    ok = np.abs(det) > 1e-6
+    safe = np.where(ok, det, 1)[:, None]
+    new0 = (bb[:, None] * ax - ab[:, None] * bx) / safe
+    new1 = (aa[:, None] * bx - ab[:, None] * ax) / safe
+    return np.where(ok[:, None], new0, e0), np.where(ok[:, None], new1, e1)
+
+
+def _encode_colors(colors, quality):
+    """ (N,) uint64 BC1 blocks for (N, 16, 3) colours, four colour mode """
+    e0, e1 = _color_endpoints(colors, quality)
+    c0, c1 = _to565(e0), _to565(e1)
+    if quality == 'best':
+        e0, e1 = _refine(colors, _color_indices(colors, _color_palette(c0, c1)), e0, e1)
+        c0, c1 = _to565(np.clip(e0, 0, 255)), _to565(np.clip(e1, 0, 255))
+
+    # four colour mode requires c0 > c1: swap endpoints where needed
+    swap = c0 < c1
+    c0, c1 = np.where(swap, c1, c0), np.where(swap, c0, c1)
+    indices = _color_indices(colors, _color_palette(c0, c1))
+    indices[c0 == c1] = 0
+
+    bits = (indices.astype(np.uint64) << (2 * np.arange(16, dtype=np.uint64))).sum(axis=1)
+    return c0.astype(np.uint64) | (c1.astype(np.uint64) << 16) | (bits << 32)
+
+
+def _encode_alpha(alpha):
+    """ (N,) uint64 BC3 alpha blocks for (N, 16) alpha values """
+    a0, a1 = alpha.max(axis=1), alpha.min(axis=1)
+    weights = np.array((7, 0, 6, 5, 4, 3, 2, 1), np.float32) / 7  # share of a0, per index
+    palette = a0[:, None] * weights + a1[:, None] * (1 - weights)
+    indices = np.abs(alpha[:, :, None] - palette[:, None, :]).argmin(axis=2).astype(np.uint64)
+    indices[a0 == a1] = 0
+    bits = (indices << (3 * np.arange(16, dtype=np.uint64))).sum(axis=1)
+    return a0.astype(np.uint64) | (a1.astype(np.uint64) << 8) | (bits << 16)
+
+
+def encode(image, fmt, quality='fast'):
+    """ BC1 or BC3 compressed bytes of a (height, width, 4) uint8 image """
+    assert quality in QUALITIES, 'Unknown encoder quality %s' % quality
+    pixels = blocks(image)
+    out = np.empty((len(pixels), BLOCK_BYTES[fmt] // 8), '<u8')
+    for start in range(0, len(pixels), CHUNK_BLOCKS):
+        chunk = pixels[start:start + CHUNK_BLOCKS].astype(np.float32)
+        out[start:start + len(chunk), -1] = _encode_colors(chunk[:, :, :3], quality)
+        if fmt == BC3:
+            out[start:start + len(chunk), 0] = _encode_alpha(chunk[:, :, 3])
+    return out.tobytes()
+
+
+# ------------  Cached compressed mip chains ---------------------------------
+def compress_file(tex_file, mip_levels, quality='fast'):
+    """ compressed mip chain of tex_file as (gl format, [(width, height,
+        bytes)]), read from tex_file.bcn when it matches the quality and
+        source stamp, else encoded from the RGBA levels mip_levels() """
+    stat = os.stat(tex_file)
+    path = tex_file + '.bcn'
+    stamp = [QUALITIES.index(quality), stat.st_size, stat.st_mtime_ns]
+
+    if os.path.exists(path):
+        data = np.memmap(path, np.uint8, mode='r')
+        magic, fmt, width, height, count, *source = (int(value) for value in data[:64].view('<u8'))
+        if magic == BCN_MAGIC and source == stamp:
+            return GL_FORMATS[fmt], _split(data[64:], fmt, width, height, count)
+
+    levels = mip_levels()
+    fmt = BC1 if (levels[0][:, :, 3] == 255).all() else BC3
+    height, width = levels[0].shape[:2]
+    header = [BCN_MAGIC, fmt, width, height, len(levels)] + stamp
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(path) or '.', delete=False) as stream:
+        stream.write(np.array(header, '<u8').tobytes())
+        for level in levels:
+            stream.write(encode(level, fmt, quality))
+    os.replace(stream.name, path)
+    data = np.memmap(path, np.uint8, mode='r')
+    return GL_FORMATS[fmt], _split(data[64:], fmt, width, height, len(levels))
+
+
+def _split(data, fmt, width, height, count):
+    """ cut concatenated compressed levels into (width, height, bytes) """
+    result, offset = [], 0
+    for _ in range(count):
+        size = -(-width // 4) * -(-height // 4) * BLOCK_BYTES[fmt]
+        result.append((width, height, data[offset:offset + size]))
+        offset += size
+        width, height = max(1, width // 2), max(1, height // 2)
+    return result
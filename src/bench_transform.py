@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+""" Micro benchmark of the batched transform.py functions against their
+    scalar versions: cost per element of N quaternions, vectors or
+    matrices, and the largest difference of their results.
+    usage: python3 bench_transform.py [elements] [repeats] """
+
+import sys
+import time
+
+import numpy as np
+
+from transform import (normalized, normalized_batch, quaternion_matrix, quaternion_matrix_batch,
+                       quaternion_nlerp, quaternion_nlerp_batch, quaternion_slerp, quaternion_slerp_batch,
+                       scale, scale_batch, translate, translate_batch, trs_batch)
+
+
+def inputs(elements):
+    """ random quaternions, translations, scales and fractions """
+    rng = np.random.default_rng(0)
+    return dict(q0=rng.normal(size=(elements, 4)).astype('f'), q1=rng.normal(size=(elements, 4)).astype('f'),
+                t=rng.normal(size=(elements, 3)).astype('f'), s=rng.uniform(.5, 2, (elements, 3)).astype('f'),
+                f=rng.uniform(0, 1, elements).astype('f'))
+
+
+# name: (scalar version of one element, batched version of all), the
+# batched ones writing in place to preallocated outputs
+def functions(data):
+    q0, q1, t, s, f = data['q0'], data['q1'], data['t'], data['s'], data['f']
+    quaternions, matrices = np.empty_like(q0), np.empty((len(q0), 4, 4), 'f')
+    return {
+        'normalized': (lambda i: normalized(q0[i]), lambda: normalized_batch(q0, quaternions)),
+        'translate': (lambda i: translate(t[i]), lambda: translate_batch(t, matrices)),
+        'scale': (lambda i: scale(s[i]), lambda: scale_batch(s, matrices)),
+        'quaternion_matrix': (lambda i: quaternion_matrix(q0[i]), lambda: quaternion_matrix_batch(q0, matrices)),
+        'quaternion_slerp': (lambda i: quaternion_slerp(q0[i], q1[i], f[i]),
+                             lambda: quaternion_slerp_batch(q0, q1, f, quaternions)),
+        'quaternion_nlerp': (lambda i: quaternion_nlerp(q0[i], q1[i], f[i]),
+                             lambda: quaternion_nlerp_batch(q0, q1, f, quaternions)),
+        'trs': (lambda i: translate(t[i]) @ quaternion_matrix(q0[i]) @ scale(s[i]),
+                lambda: trs_batch(t, q0, s, matrices)),
+    }
+
+
+def per_element(function, elements, repeats):
+    """ microseconds per element of repeated calls of function() """
+    function()  # warm up
+    start = time.perf_counter()
+    for _ in range(repeats):
+        function()
+    return (time.perf_counter() - start) * 1e6 / (repeats * elements)
+
+
+def main():
+    elements = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    data = inputs(elements)
+    print('%d elements, %d repeats, us per element' % (elements, repeats))
+    print('%-18s %8s %8s %8s %10s' % ('function', 'scalar', 'batched', 'speedup', 'max diff'))
+    for name, (scalar, batched) in functions(data).items():
+        scalar_time = per_element(lambda: [scalar(i) for i in range(elements)], elements, max(repeats // 10, 1))
+        batched_time = per_element(batched, elements, repeats)
+        difference = np.abs(np.array([scalar(i) for i in range(elements)]) - batched()).max()
+        print('%-18s %8.3f %8.3f %7.0fx %10.1e' % (name, scalar_time, batched_time,
+                                                     scalar_time / batched_time, difference))
+
+
+if __name__ == '__main__':
+    main()
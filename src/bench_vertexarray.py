@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+""" Micro benchmark of per frame vertex uploads: a particle system of
+    moving points drawn from a VertexArray recreated every frame, updated
+    in place with glBufferSubData, or streamed through a ring buffer.
+    usage: python3 bench_vertexarray.py [particles] [frames] """
+
+import sys
+import time
+
+import glfw
+import numpy as np
+import OpenGL.GL as GL
+
+from glresources import resources
+from glstate import state
+from shader import Shader
+from vertexarray import VertexArray
+
+POINT_VERT = """#version 330 core
+layout(location = 0) in vec3 position;
+void main() { gl_Position = vec4(position, 1); gl_PointSize = 1; }"""
+
+POINT_FRAG = """#version 330 core
+out vec4 outColor;
+void main() { outColor = vec4(1); }"""
+
+
+def particle_frames(particles, count=8):
+    """ a few precomputed frames of particle positions, so that the
+        benchmark measures uploads rather than the particle simulation """
+    rng = np.random.default_rng(0)
+    return [rng.uniform(-1, 1, (particles, 3)).astype(np.float32) for _ in range(count)]
+
+
+def recreate(first):
+    """ new vertex array and buffer for every frame, the previous ones
+        deleted at the end of the frame """
+    vertex_array = None
+
+    def frame(positions):
+        nonlocal vertex_array
+        if vertex_array is not None:
+            vertex_array.release()
+        vertex_array = VertexArray([positions], usage=GL.GL_STREAM_DRAW)
+        return vertex_array
+    return frame
+
+
+def sub_data(first):
+    """ one vertex array, its buffer overwritten in place every frame """
+    vertex_array = VertexArray([first], usage=GL.GL_DYNAMIC_DRAW)
+
+    def frame(positions):
+        vertex_array.update([positions])
+        return vertex_array
+    return frame
+
+
+def ring(first, frames=3):
+    """ one vertex array streaming frames through a triple buffered ring """
+    vertex_array = VertexArray([first], usage=GL.GL_STREAM_DRAW, frames=frames)
+
+    def frame(positions):
+        vertex_array.stream([positions])
+        return vertex_array
+    return frame
+
+
+MODES = {'recreate': recreate, 'subdata': sub_data, 'ring': ring}
+
+
+def bench(mode, positions, frames):
+    """ milliseconds per frame of uploading then drawing the particles,
+        released GL objects deleted after each frame as Viewer.run does """
+    shader = Shader(POINT_VERT, POINT_FRAG)
+    state.use_program(shader.glid)
+    frame = MODES[mode](positions[0])
+    for i in range(len(positions)):  # warm up the driver
+        frame(positions[i]).execute(GL.GL_POINTS)
+        resources.collect()
+    GL.glFinish()
+
+    start = time.perf_counter()
+    for i in range(frames):
+        GL.glClear(GL.GL_COLOR_BUFFER_BIT)
+        frame(positions[i % len(positions)]).execute(GL.GL_POINTS)
+        GL.glFlush()
+        resources.collect()
+    GL.glFinish()
+    return (time.perf_counter() - start) * 1000 / frames
+
+
+def main():
+    particles = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    frames = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    # hidden core profile window, as the viewer's
+    glfw.window_hint(glfw.CONTEXT_VERSION_MAJOR, 3)
+    glfw.window_hint(glfw.CONTEXT_VERSION_MINOR, 3)
+    glfw.window_hint(glfw.OPENGL_FORWARD_COMPAT, GL.GL_TRUE)
+    glfw.window_hint(glfw.OPENGL_PROFILE, glfw.OPENGL_CORE_PROFILE)
+    glfw.window_hint(glfw.VISIBLE, False)
+    win = glfw.create_window(640, 480, 'bench', None, None)
+    glfw.make_context_current(win)
+    GL.glEnable(GL.GL_PROGRAM_POINT_SIZE)
+
+    positions = particle_frames(particles)
+    print('%d particles, %d frames, %s' % (particles, frames, GL.glGetString(GL.GL_RENDERER).decode()))
+    for mode in MODES:
+        print('%-8s %7.3f ms/frame' % (mode, bench(mode, positions, frames)))
+
+
+if __name__ == '__main__':
+    glfw.init()
+    main()
+    glfw.terminate()
@@ -1,8 +1,8 @@
 import copy
 import numpy as np
 import glfw
-from PIL import Image
 
+from heightfield import HEIGHTMAP, load_heightfield
 from transform import normalized
 
 
@@ -25,8 +25,8 @@ class Camera:
 
 		self.sensitivity = 0.01
 
-		self.hmap_file = "../resources/hmap.png"
-		self.heightmapTexture = np.asarray(Image.open(self.hmap_file).convert('RGB'))
+		self.hmap_file = HEIGHTMAP
+		self.heightfield = load_heightfield(self.hmap_file)
 
 	def processInput(self, window, deltaTime):
 		self.cameraPos[1] = self.cameraPositionXZ() + 3
@@ -91,12 +91,8 @@ class Camera:
 				self.cameraFront[1] -= self.sensitivity
 
 	def cameraPositionXZ(self):
-		x = int(((self.cameraPos[2] + 300) / 1000) * self.heightmapTexture.shape[0])
-		z = int(((self.cameraPos[0] + 300) / 1000) * self.heightmapTexture.shape[0])
-		if 0 < x < self.heightmapTexture.shape[0] or 0 < z < self.heightmapTexture.shape[0]:
-			return (self.heightmapTexture[x, z, 0] / 256) * 100
-		else:
-			return 0
+		""" height of the ground under the camera """
+		return self.heightfield.height(self.cameraPos[0], self.cameraPos[2])
 
 	def get_cameraPos(self):
 		return self.cameraPos
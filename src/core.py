@@ -1,171 +1,197 @@
 # Python built-in modules
 import os  # os function, i.e. checking file status
 import glfw
-import assimpcy
 import numpy as np  # all matrix manipulations & OpenGL args
 import random
 import math
 
 # External, non built-in modules
-from mesh import TexturedPhongMesh, TexturedPhongMeshSkinned
-from skinning import SkinningControlNode, MAX_VERTEX_BONES, MAX_BONES
-from texture import Texture
+from mesh import InstancedMesh, TexturedPhongMesh, TexturedPhongMeshSkinned
+from skinning import SkinningControlNode
+from staticbatch import StaticBatches
+from transformstore import TransformStore
+from assetcache import PHONG_FLAGS, SKINNED_FLAGS
+from registry import mesh_attributes, registry
+from resindex import find_resource
 from node import Node
 from keyframe import KeyFrameControlNode
 from transform import quaternion, rotate, translate, scale, vec, quaternion_from_axis_angle
-from camera import Camera
+from heightfield import load_heightfield
+
+# ground height where the camera starts, props are placed relative to it
+GROUND = load_heightfield().height(0, 3)
+
+# ----- assets used by add_animation and add_objects, imported ahead by preload
+ROGALIK_TEXTURE = "./../resources/characters/Rogalic/Texture/Rogalik_texture.psd"
+GOLEM_TEXTURE = "./../resources/characters/Golem/Texture/Golem.psd"
+SKINNED_ASSETS = [
+    ("./../resources/characters/Rogalic/Rogalic_run.fbx", ROGALIK_TEXTURE),
+    ("./../resources/characters/Rogalic/Rogalic_attack_1.fbx", ROGALIK_TEXTURE),
+    ("./../resources/characters/Rogalic/Rogalic_victory.fbx", ROGALIK_TEXTURE),
+    ("./../resources/characters/Golem/Golem_idle.fbx", GOLEM_TEXTURE),
+    ("./../resources/characters/Golem/Golem_attack_1.fbx", GOLEM_TEXTURE),
+    ("./../resources/characters/Golem/Golem_death.fbx", GOLEM_TEXTURE),
+    ("./../resources/Seagull/seagul.FBX", "./../resources/Seagull/texture/gull.png"),
+]
+NATURE_ATLAS = "./../resources/FantasyWorld/Textures/Nature_Atlas_1.tga"
+PHONG_ASSETS = [
+    ("./../resources/FantasyWorld/Constructable_Elements/Barrel_01.FBX", NATURE_ATLAS),
+    ("./../resources/FantasyWorld/Constructable_Elements/Barrel_02.FBX", NATURE_ATLAS),
+    ("./../resources/FantasyWorld/Constructable_Elements/HouseMushroom.FBX", NATURE_ATLAS),
+    ("./../resources/FantasyWorld/Constructable_Elements/HouseMushroom_Window.FBX", NATURE_ATLAS),
+]
+
+
+def preload(loader):
+    """ import and decode all scene assets in parallel, then upload them """
+    for file, tex_file in SKINNED_ASSETS:
+        loader.prefetch(file, SKINNED_FLAGS, [tex_file])
+    for file, tex_file in PHONG_ASSETS:
+        loader.prefetch(file, PHONG_FLAGS, [tex_file])
+    loader.upload()
+
+
+def find_texture(file, name):
+    """ path of texture 'name' searched in the subtree of file's directory """
+    path = os.path.dirname(file) if os.path.dirname(file) != '' else './'
+    found = find_resource(path, name)
+    assert found, 'Cannot find texture %s in %s subtree' % (name, path)
+    return found
 
-camera = Camera()
 
 def load_phong_mesh(file, shader, tex_file, k_a, k_d, k_s, s):
-    try:
-        pp = assimpcy.aiPostProcessSteps
-        flags = pp.aiProcess_Triangulate | pp.aiProcess_FlipUVs
-        scene = assimpcy.aiImportFile(file, flags)
-    except assimpcy.all.AssimpError as exception:
-        print('ERROR loading', file + ': ', exception.args[0].decode())
+    material = (shader.glid, tex_file, k_a, k_d, k_s, s)
+    return list(registry.drawables(file, PHONG_FLAGS, material,
+                                   lambda: _load_phong_mesh(file, shader, tex_file, k_a, k_d, k_s, s)))
+
+
+def _load_phong_mesh(file, shader, tex_file, k_a, k_d, k_s, s):
+    scene = registry.scene(file, PHONG_FLAGS)
+    if scene is None:
         return []
 
     # ----- Pre-load textures; embedded textures not supported at the moment
-    path = os.path.dirname(file) if os.path.dirname(file) != '' else './'
-    for mat in scene.mMaterials:
-        if not tex_file and 'TEXTURE_BASE' in mat.properties:
-            name = os.path.basename(mat.properties['TEXTURE_BASE'])
-            paths = os.walk(path, followlinks=True)
-            found = [os.path.join(d, f) for d, _, n in paths for f in n
-                     if name.startswith(f) or f.startswith(name)]
-            assert found, 'Cannot find texture %s in %s subtree' % (name, path)
-            tex_file = found[0]
-        if tex_file:
-            mat.properties['diffuse_map'] = Texture(tex_file=tex_file)
+    diffuse_maps = []
+    for name in scene.textures:
+        if not tex_file and name:
+            tex_file = find_texture(file, name)
+        diffuse_maps.append(registry.texture(tex_file) if tex_file else None)
 
     meshes = []
-    for mesh in scene.mMeshes:
-        mat = scene.mMaterials[mesh.mMaterialIndex].properties
-        assert mat['diffuse_map'], "Mapping using a textureless material"
-        attributes = [mesh.mVertices, mesh.mTextureCoords[0], mesh.mNormals]
-        mesh = TexturedPhongMesh(shader=shader, tex=mat['diffuse_map'], attributes=attributes,
-                                 faces=mesh.mFaces,
-                                 k_d=k_d, k_a=k_a, k_s=k_s, s=s)
-        meshes.append(mesh)
-
-        size = sum((mesh.mNumFaces for mesh in scene.mMeshes))
+    for mesh_id, mesh in enumerate(scene.meshes):
+        assert diffuse_maps[mesh.material], "Mapping using a textureless material"
+        vertex_array = registry.vertex_array(file, PHONG_FLAGS, mesh_id, mesh)
+        meshes.append(TexturedPhongMesh(shader=shader, tex=diffuse_maps[mesh.material],
+                                        attributes=None, faces=mesh.faces,
+                                        k_d=k_d, k_a=k_a, k_s=k_s, s=s, vertex_array=vertex_array))
     return meshes
 
 
 def load_phong_skinned_mesh(file, shader, tex_file, k_a, k_d, k_s, s, delay=None):
-    try:
-        pp = assimpcy.aiPostProcessSteps
-        flags = pp.aiProcess_Triangulate | pp.aiProcess_GenSmoothNormals
-        scene = assimpcy.aiImportFile(file, flags)
-    except assimpcy.all.AssimpError as exception:
-        print('ERROR loading', file + ': ', exception.args[0].decode())
+    """ skinned meshes share geometry and textures, not their bone nodes """
+    scene = registry.scene(file, SKINNED_FLAGS)
+    if scene is None:
         return []
 
     # ----- Pre-load textures; embedded textures not supported at the moment
-    path = os.path.dirname(file) if os.path.dirname(file) != '' else './'
-    for mat in scene.mMaterials:
-        if not tex_file and 'TEXTURE_BASE' in mat.properties:  # texture token
-            name = os.path.basename(mat.properties['TEXTURE_BASE'])
-            paths = os.walk(path, followlinks=True)
-            found = [os.path.join(d, f) for d, _, n in paths for f in n
-                     if name.startswith(f) or f.startswith(name)]
-            assert found, 'Cannot find texture %s in %s subtree' % (name, path)
-            tex_file = found[0]
-        if tex_file:
-            mat.properties['diffuse_map'] = Texture(tex_file=tex_file)
-
-    def conv(assimp_keys, ticks_per_second):
-        """ Conversion from assimp key struct to our dict representation """
-        return {key.mTime / ticks_per_second: key.mValue for key in assimp_keys}
-
-    transform_keyframes = {}
-    if scene.mAnimations:
-        anim = scene.mAnimations[0]
-        for channel in anim.mChannels:
-            transform_keyframes[channel.mNodeName] = (
-                conv(channel.mPositionKeys, anim.mTicksPerSecond),
-                conv(channel.mRotationKeys, anim.mTicksPerSecond),
-                conv(channel.mScalingKeys, anim.mTicksPerSecond)
-            )
+    diffuse_maps = []
+    for name in scene.textures:
+        if not tex_file and name:  # texture token
+            tex_file = find_texture(file, name)
+        diffuse_maps.append(registry.texture(tex_file) if tex_file else None)
+
+    def conv(times, values):
+        """ Conversion from cached key arrays to our dict representation """
+        return dict(zip(times.tolist(), values))
+
+    transform_keyframes = {name: tuple(conv(*keys) for keys in channel)
+                           for name, channel in scene.channels.items()}
 
     # ---- prepare scene graph nodes
     nodes = {}  # nodes name -> node lookup
-    nodes_per_mesh_id = [[] for _ in scene.mMeshes]  # nodes holding a mesh_id
+    nodes_per_mesh_id = [[] for _ in scene.meshes]  # nodes holding a mesh_id
 
-    def make_nodes(assimp_node):
+    def make_nodes(node_data):
         """ Recursively builds nodes for our graph, matching assimp nodes """
-        keyframes = transform_keyframes.get(assimp_node.mName, (None,))
-        node = SkinningControlNode(*keyframes, transform=assimp_node.mTransformation, delay=delay)
-        nodes[assimp_node.mName] = node
-        for mesh_index in assimp_node.mMeshes:
+        keyframes = transform_keyframes.get(node_data.name, (None,))
+        node = SkinningControlNode(*keyframes, transform=node_data.transform, delay=delay)
+        nodes[node_data.name] = node
+        for mesh_index in node_data.meshes:
             nodes_per_mesh_id[mesh_index] += [node]
-        node.add(*(make_nodes(child) for child in assimp_node.mChildren))
+        node.add(*(make_nodes(child) for child in node_data.children))
         return node
 
-    root_node = make_nodes(scene.mRootNode)
-
-    for mesh_id, mesh in enumerate(scene.mMeshes):
-        vbone = np.array([[(0, 0)] * MAX_BONES] * mesh.mNumVertices,
-                          dtype=[('weight', 'f4'), ('id', 'u4')])
-        for bone_id, bone in enumerate(mesh.mBones[:MAX_BONES]):
-            for entry in bone.mWeights: 
-                vbone[entry.mVertexId][bone_id] = (entry.mWeight, bone_id)
-
-        vbone.sort(order='weight') 
-        vbone = vbone[:, -MAX_VERTEX_BONES:] 
+    # the skeleton's transforms updated level by level in flat arrays, owned
+    # by its root whose Node.world updates them
+    root_node = make_nodes(scene.root)
+    root_node.store = TransformStore(root_node)
 
-        bone_nodes = [nodes[bone.mName] for bone in mesh.mBones]
-        bone_offsets = [bone.mOffsetMatrix for bone in mesh.mBones]
-
-    for mesh in scene.mMeshes:
-        mat = scene.mMaterials[mesh.mMaterialIndex].properties
-        assert mat['diffuse_map'], "Mapping using a textureless material"
-        attributes = [mesh.mVertices, mesh.mTextureCoords[0], mesh.mNormals, vbone['id'], vbone['weight']]
-        mesh = TexturedPhongMeshSkinned(shader=shader, tex=mat['diffuse_map'], attributes=attributes,
-                                        faces=mesh.mFaces, bone_nodes=bone_nodes, bone_offsets=bone_offsets,
-                                        k_d=k_d, k_a=k_a, k_s=k_s, s=s)
+    for mesh_id, mesh in enumerate(scene.meshes):
+        assert diffuse_maps[mesh.material], "Mapping using a textureless material"
+        bone_nodes = [nodes[name] for name in mesh.bone_names]
+        vertex_array = registry.vertex_array(file, SKINNED_FLAGS, mesh_id, mesh)
+        mesh = TexturedPhongMeshSkinned(shader=shader, tex=diffuse_maps[mesh.material], attributes=None,
+                                        faces=mesh.faces, bone_nodes=bone_nodes, bone_offsets=mesh.bone_offsets,
+                                        k_d=k_d, k_a=k_a, k_s=k_s, s=s, vertex_array=vertex_array)
 
         for node in nodes_per_mesh_id[mesh_id]:
             node.add(mesh)
 
-        nb_triangles = sum((mesh.mNumFaces for mesh in scene.mMeshes))
-
     return [root_node]
 
+
 def load_texture(file, shader, tex_file, k_a, k_d, k_s, s):
     """ load resources from file using assimp, return list of TexturedMesh """
-    try:
-        pp = assimpcy.aiPostProcessSteps
-        flags = pp.aiProcess_Triangulate | pp.aiProcess_FlipUVs
-        scene = assimpcy.aiImportFile(file, flags)
-    except assimpcy.all.AssimpError as exception:
-        print('ERROR loading', file + ': ', exception.args[0].decode())
-        return []
+    material = (shader.glid, tuple(tex_file or ()), k_a, k_d, k_s, s)
+    return list(registry.drawables(file, PHONG_FLAGS, material,
+                                   lambda: _load_texture(file, shader, tex_file, k_a, k_d, k_s, s)))
+
+
+def load_instanced(file, shader, tex_file, transforms, k_a, k_d, k_s, s):
+    """ one InstancedMesh per mesh of file, with an instance per transform;
+        not shared through the registry as their instances are their own """
+    meshes = _load_texture(file, shader, tex_file, k_a, k_d, k_s, s, mesh_class=InstancedMesh)
+    for mesh in meshes:
+        for transform in transforms:
+            mesh.add_instance(transform)
+    return meshes
 
-    # ----- Pre-load textures; embedded textures not supported at the moment
-    path = os.path.dirname(file) if os.path.dirname(file) != '' else './'
-    for index, mat in enumerate(scene.mMaterials):
-        if not tex_file and 'TEXTURE_BASE' in mat.properties:  # texture token
-            name = os.path.basename(mat.properties['TEXTURE_BASE'])
-            paths = os.walk(path, followlinks=True)
-            found = [os.path.join(d, f) for d, _, n in paths for f in n
-                     if name.startswith(f) or f.startswith(name)]
-            assert found, 'Cannot find texture %s in %s subtree' % (name, path)
-            tex_file = found[0]
-        if tex_file:
-            mat.properties['diffuse_map'] = Texture(tex_file=tex_file[index])
 
+def load_static(batches, file, shader, tex_file, transform, k_a, k_d, k_s, s):
+    """ merge the meshes of file placed by transform into StaticBatches """
+    scene = registry.scene(file, PHONG_FLAGS)
+    if scene is None:
+        return
+    diffuse_maps = _diffuse_maps(file, scene, tex_file)
+    for mesh in scene.meshes:
+        assert diffuse_maps[mesh.material], "Mapping using a textureless material"
+        batches.add_mesh(shader, diffuse_maps[mesh.material], mesh_attributes(mesh), mesh.faces, transform,
+                         k_a=k_a, k_d=k_d, k_s=k_s, s=s)
+
+
+def _diffuse_maps(file, scene, tex_file):
+    """ texture per material of scene, files given per material or found
+        from the scene's texture names; embedded textures not supported """
+    diffuse_maps = []
+    for index, name in enumerate(scene.textures):
+        if not tex_file and name:  # texture token
+            tex_file = [find_texture(file, name)] * len(scene.textures)
+        diffuse_maps.append(registry.texture(tex_file[index]) if tex_file else None)
+    return diffuse_maps
+
+
+def _load_texture(file, shader, tex_file, k_a, k_d, k_s, s, mesh_class=TexturedPhongMesh):
+    scene = registry.scene(file, PHONG_FLAGS)
+    if scene is None:
+        return []
+
+    diffuse_maps = _diffuse_maps(file, scene, tex_file)
     meshes = []
-    for mesh in scene.mMeshes:
-        mat = scene.mMaterials[mesh.mMaterialIndex].properties
-        assert mat['diffuse_map'], "Mapping using a textureless material"
-        attributes = [mesh.mVertices, mesh.mTextureCoords[0], mesh.mNormals]
-        mesh = TexturedPhongMesh(shader, mat['diffuse_map'], attributes, mesh.mFaces,
-                                 k_d=k_d, k_a=k_a, k_s=k_s, s=s)
-        meshes.append(mesh)
-
-    size = sum((mesh.mNumFaces for mesh in scene.mMeshes))
+    for mesh_id, mesh in enumerate(scene.meshes):
+        assert diffuse_maps[mesh.material], "Mapping using a textureless material"
+        vertex_array = registry.vertex_array(file, PHONG_FLAGS, mesh_id, mesh)
+        meshes.append(mesh_class(shader, diffuse_maps[mesh.material], None, mesh.faces,
+                                 k_d=k_d, k_a=k_a, k_s=k_s, s=s, vertex_array=vertex_array))
     return meshes
 
 
@@ -173,8 +199,8 @@ def add_animation(viewer, shader):
     # Knight Run
     keyframe_knight_node = KeyFrameControlNode(
         translate_keys={
-               0.1: vec(0, camera.cameraPositionXZ() + 3, 30),
-                10: vec(-50, camera.cameraPositionXZ() + 3, 30)}, 
+               0.1: vec(0, GROUND + 3, 30),
+                10: vec(-50, GROUND + 3, 30)}, 
         rotate_keys={ 0.1: quaternion_from_axis_angle(axis=(0, 1, 0), degrees=90), 10: quaternion_from_axis_angle(axis=(0, 1, 0), degrees=90), 
                     },
         scale_keys={ 0: 0.5,  9.9: 0.5, 10: 0,
@@ -199,7 +225,7 @@ def add_animation(viewer, shader):
 
     # Knight Attack
     keyframe_knight_node = KeyFrameControlNode(
-        translate_keys={ 10: vec(0, camera.cameraPositionXZ() + 3, 30)},
+        translate_keys={ 10: vec(0, GROUND + 3, 30)},
         rotate_keys={10: quaternion_from_axis_angle(axis=(0, 1, 0), degrees=90)},
         scale_keys={ 10: 0, 10.1: 0.5, 17.9: 0.5, 18: 0},
     )
@@ -222,7 +248,7 @@ def add_animation(viewer, shader):
 
     # Knight Victory
     keyframe_knight_node = KeyFrameControlNode(
-        translate_keys={ 17: vec(5, camera.cameraPositionXZ() + 3, 30)},
+        translate_keys={ 17: vec(5, GROUND + 3, 30)},
         rotate_keys={0: quaternion_from_axis_angle(axis=(0, 1, 0), degrees=190)},
         scale_keys={ 17.9: 0, 18: 0.5, 25: 0.5},
     )
@@ -246,7 +272,7 @@ def add_animation(viewer, shader):
     # Golem Idle
     keyframe_golem_node = KeyFrameControlNode(
         translate_keys={
-               10: vec(15, camera.cameraPositionXZ() + 3, 30)},
+               10: vec(15, GROUND + 3, 30)},
         rotate_keys={10: quaternion_from_axis_angle(axis=(0, 1, 0), degrees=-90), 
                     },
         scale_keys={ 0: 0.5,  9.9: 0.5, 10: 0},
@@ -269,7 +295,7 @@ def add_animation(viewer, shader):
 
      # Golem Attack
     keyframe_golem_node = KeyFrameControlNode(
-        translate_keys={ 10: vec(15, camera.cameraPositionXZ() + 3, 30)},
+        translate_keys={ 10: vec(15, GROUND + 3, 30)},
         rotate_keys={10: quaternion_from_axis_angle(axis=(0, 1, 0), degrees=-90)},
         scale_keys={ 9.9: 0, 10: 0.5, 17.9: 0.5, 18: 0},
     )
@@ -291,7 +317,7 @@ def add_animation(viewer, shader):
 
      # Golem Death
     keyframe_golem_node = KeyFrameControlNode(
-        translate_keys={ 17: vec(15, camera.cameraPositionXZ() + 3, 30)},
+        translate_keys={ 17: vec(15, GROUND + 3, 30)},
         rotate_keys={17: quaternion_from_axis_angle(axis=(0, 1, 0), degrees=-90)},
         scale_keys={ 17.9: 0, 18: 0.5, 19.1: 0.5, 19.2: 0},
     )
@@ -314,8 +340,8 @@ def add_animation(viewer, shader):
     # Bird 1
     keyframe_seagull_node = KeyFrameControlNode(
         translate_keys={
-            0.1: vec(30, camera.cameraPositionXZ() + 10, 30),
-            20: vec(-5, camera.cameraPositionXZ() + 10, 30),
+            0.1: vec(30, GROUND + 10, 30),
+            20: vec(-5, GROUND + 10, 30),
             },
         rotate_keys={17: quaternion_from_axis_angle(axis=(0, 1, 0), degrees=-90)},
         scale_keys={ 0: 1, 19.9: 1, 20: 0},
@@ -339,8 +365,8 @@ def add_animation(viewer, shader):
     # Bird 2
     keyframe_seagull_node = KeyFrameControlNode(
         translate_keys={
-            0.1: vec(-25, camera.cameraPositionXZ() + 12, 30),
-            20: vec(10, camera.cameraPositionXZ() + 12, 30),
+            0.1: vec(-25, GROUND + 12, 30),
+            20: vec(10, GROUND + 12, 30),
             },
         rotate_keys={17: quaternion_from_axis_angle(axis=(0, 1, 0), degrees=90)},
         scale_keys={ 0: 0.8, 19.9: 0.8, 20: 0},
@@ -364,8 +390,8 @@ def add_animation(viewer, shader):
     # Bird 2
     keyframe_seagull_node = KeyFrameControlNode(
         translate_keys={
-            20.1: vec(30, camera.cameraPositionXZ() + 10, 30),
-            40: vec(-5, camera.cameraPositionXZ() + 10, 30),
+            20.1: vec(30, GROUND + 10, 30),
+            40: vec(-5, GROUND + 10, 30),
             },
         rotate_keys={17: quaternion_from_axis_angle(axis=(0, 1, 0), degrees=-90)},
         scale_keys={ 19.9: 0, 20: 0.5, 40: 0},
@@ -386,89 +412,51 @@ def add_animation(viewer, shader):
     keyframe_seagull_node.add(seagull_node)
     viewer.add(keyframe_seagull_node)
 
-def add_objects(viewer, shader):
+def add_objects(viewer, shader, instanced_shader):
     tex_list = ["./../resources/FantasyWorld/Textures/Nature_Atlas_1.tga"]
+    # barrels never move: merged into one buffer, drawn in one multi-draw call
     tree_size = 0.6
-    tree_node = Node(
-        transform=translate(53, camera.cameraPositionXZ() + 3, 50.2) @ scale(tree_size, tree_size, tree_size) @ rotate((1, 0, 0), -90))
-    mesh_list = load_texture(file="./../resources/FantasyWorld/Constructable_Elements/Barrel_02.FBX", shader=shader,
-                                    tex_file=tex_list,
-                                    k_a=(.4, .4, .4),
-                                    k_d=(1.2, 1.2, 1.2),
-                                    k_s=(.2, .2, .2),
-                                    s=4
-                                    )
-    for mesh in mesh_list:
-        tree_node.add(mesh)
-    viewer.add(tree_node)
-
-    tree_node = Node(
-    transform=translate(53, camera.cameraPositionXZ() + 5, 50.2) @ scale(tree_size, tree_size, tree_size) @ rotate((1, 0, 0), -90))
-    mesh_list = load_texture(file="./../resources/FantasyWorld/Constructable_Elements/Barrel_01.FBX", shader=shader,
-                                    tex_file=tex_list,
-                                    k_a=(.4, .4, .4),
-                                    k_d=(1.2, 1.2, 1.2),
-                                    k_s=(.2, .2, .2),
-                                    s=4
-                                    )
-    for mesh in mesh_list:
-        tree_node.add(mesh)
-    viewer.add(tree_node)
-
-
-    tree_size = 0.8
-    tree_node = Node(
-        transform=translate(93, camera.cameraPositionXZ() + 3, 50.2) @ scale(tree_size, tree_size, tree_size) @ rotate((1, 0, 0), -90))
-    mesh_list = load_texture(file="./../resources/FantasyWorld/Constructable_Elements/HouseMushroom.FBX", shader=shader,
-                                    tex_file=tex_list,
-                                    k_a=(.4, .4, .4),
-                                    k_d=(1.2, 1.2, 1.2),
-                                    k_s=(.2, .2, .2),
-                                    s=4
-                                    )
-    for mesh in mesh_list:
-        tree_node.add(mesh)
-    viewer.add(tree_node)
-
-    tree_node = Node(
-    transform=translate(96, camera.cameraPositionXZ() + 5, 50.2) @ scale(tree_size, tree_size, tree_size) @ rotate((1, 0, 0), -90))
-    mesh_list = load_texture(file="./../resources/FantasyWorld/Constructable_Elements/HouseMushroom_Window.FBX", shader=shader,
-                                    tex_file=tex_list,
-                                    k_a=(.4, .4, .4),
-                                    k_d=(1.2, 1.2, 1.2),
-                                    k_s=(.2, .2, .2),
-                                    s=4
-                                    )
-    for mesh in mesh_list:
-        tree_node.add(mesh)
-    viewer.add(tree_node)
-
-
-
-    # HOUSE SMALL IN SCENE  
-    tree_size = 0.4
-    tree_node = Node(
-        transform=translate(53, camera.cameraPositionXZ() + 3, 90.2) @ scale(tree_size, tree_size, tree_size) @ rotate((1, 0, 0), -90))
-    mesh_list = load_texture(file="./../resources/FantasyWorld/Constructable_Elements/HouseMushroom.FBX", shader=shader,
-                                    tex_file=tex_list,
-                                    k_a=(.4, .4, .4),
-                                    k_d=(1.2, 1.2, 1.2),
-                                    k_s=(.2, .2, .2),
-                                    s=4
-                                    )
-    for mesh in mesh_list:
-        tree_node.add(mesh)
-    viewer.add(tree_node)
-
-    tree_node = Node(
-    transform=translate(55, camera.cameraPositionXZ() + 5, 90.2) @ scale(tree_size, tree_size, tree_size) @ rotate((1, 0, 0), -90))
-    mesh_list = load_texture(file="./../resources/FantasyWorld/Constructable_Elements/HouseMushroom_Window.FBX", shader=shader,
-                                    tex_file=tex_list,
-                                    k_a=(.4, .4, .4),
-                                    k_d=(1.2, 1.2, 1.2),
-                                    k_s=(.2, .2, .2),
-                                    s=4
-                                    )
-    for mesh in mesh_list:
-        tree_node.add(mesh)
-    viewer.add(tree_node)
+    static = StaticBatches()
+    load_static(static, file="./../resources/FantasyWorld/Constructable_Elements/Barrel_02.FBX", shader=shader,
+                tex_file=tex_list,
+                transform=translate(53, GROUND + 3, 50.2) @ scale(tree_size, tree_size, tree_size) @ rotate((1, 0, 0), -90),
+                k_a=(.4, .4, .4),
+                k_d=(1.2, 1.2, 1.2),
+                k_s=(.2, .2, .2),
+                s=4
+                )
+    load_static(static, file="./../resources/FantasyWorld/Constructable_Elements/Barrel_01.FBX", shader=shader,
+                tex_file=tex_list,
+                transform=translate(53, GROUND + 5, 50.2) @ scale(tree_size, tree_size, tree_size) @ rotate((1, 0, 0), -90),
+                k_a=(.4, .4, .4),
+                k_d=(1.2, 1.2, 1.2),
+                k_s=(.2, .2, .2),
+                s=4
+                )
+    viewer.add(static)
+
+    # mushroom houses, big and small: one instanced draw call per mesh
+    house_size, small_size = 0.8, 0.4
+    mesh_list = load_instanced(file="./../resources/FantasyWorld/Constructable_Elements/HouseMushroom.FBX",
+                               shader=instanced_shader, tex_file=tex_list,
+                               transforms=[
+                                   translate(93, GROUND + 3, 50.2) @ scale(house_size, house_size, house_size) @ rotate((1, 0, 0), -90),
+                                   translate(53, GROUND + 3, 90.2) @ scale(small_size, small_size, small_size) @ rotate((1, 0, 0), -90)],
+                               k_a=(.4, .4, .4),
+                               k_d=(1.2, 1.2, 1.2),
+                               k_s=(.2, .2, .2),
+                               s=4
+                               )
+    viewer.add(*mesh_list)
+
+    mesh_list = load_instanced(file="./../resources/FantasyWorld/Constructable_Elements/HouseMushroom_Window.FBX",
+                               shader=instanced_shader, tex_file=tex_list,
+                               transforms=[
+                                   translate(96, GROUND + 5, 50.2) @ scale(house_size, house_size, house_size) @ rotate((1, 0, 0), -90),
+                                   translate(55, GROUND + 5, 90.2) @ scale(small_size, small_size, small_size) @ rotate((1, 0, 0), -90)],
+                               k_a=(.4, .4, .4),
+                               k_d=(1.2, 1.2, 1.2),
+                               k_s=(.2, .2, .2),
+                               s=4
+                               )
+    viewer.add(*mesh_list)
@@ -1,14 +1,66 @@
+import os
+import hashlib
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import OpenGL.GL as GL
 import numpy as np
 from PIL import Image
 
+from bcn import compress_file
+from diskcache import CACHE_DIR, stat_hash
+from glresources import resources
+from glstate import state
+
+CUBE_MAGIC = 0x45425543  # 'CUBE': header is magic, width, height, channels
+
+
+def _decode(file):
+	""" imports image as a numpy array in exactly right format, no GL call """
+	return np.asarray(Image.open(file))
+
+
+def cook_cube(files):
+	""" decode the six faces concurrently and store them as one raw cube in
+		the cache directory, returns the path of the cooked file """
+	key = hashlib.sha1(''.join(stat_hash(file) for file in files).encode()).hexdigest()
+	path = os.path.join(CACHE_DIR, 'cube-%s.raw' % key)
+	if not os.path.exists(path):
+		with ThreadPoolExecutor(max_workers=len(files)) as pool:
+			faces = list(pool.map(_decode, files))
+		assert all(face.shape == faces[0].shape for face in faces), 'Cubemap faces differ in size'
+		height, width = faces[0].shape[:2]
+		channels = faces[0].shape[2] if faces[0].ndim == 3 else 1
+		os.makedirs(CACHE_DIR, exist_ok=True)
+		with tempfile.NamedTemporaryFile(dir=CACHE_DIR, delete=False) as stream:
+			stream.write(np.array([CUBE_MAGIC, width, height, channels], '<u4').tobytes())
+			for face in faces:
+				stream.write(np.ascontiguousarray(face, np.uint8).tobytes())
+		os.replace(stream.name, path)
+	return path
+
+
+def load_cube(files):
+	""" (6, height, width, channels) faces memory mapped from the cooked cube,
+		cooking it on first use """
+	data = np.memmap(cook_cube(files), np.uint8, mode='r')
+	magic, width, height, channels = (int(value) for value in data[:16].view('<u4'))
+	assert magic == CUBE_MAGIC, 'Corrupted cooked cubemap for %s' % files[0]
+	return data[16:].reshape(len(files), height, width, channels)
+
 
 class Cubemap:
 	# https://www.khronos.org/registry/OpenGL-Refpages/es2.0/xhtml/glTexParameter.xml
 	# Inspired by TP5
-	def __init__(self, file):
+	FORMATS = {1: GL.GL_RED, 2: GL.GL_RG, 3: GL.GL_RGB, 4: GL.GL_RGBA}
+
+	def __init__(self, file, compression=None):
+		""" compression: None for raw faces, else BC1/BC3 encoder quality """
+		self.compression = compression
 		self.glid = GL.glGenTextures(1)
-		GL.glBindTexture(GL.GL_TEXTURE_CUBE_MAP, self.glid)
+		self.key = resources.track('texture', self.glid, self, category='cubemap', label=file[0])
+		state.bind_texture(GL.GL_TEXTURE_CUBE_MAP, self.glid)
 		try:
 			self.__load(file)
 			GL.glTexParameteri(GL.GL_TEXTURE_CUBE_MAP, GL.GL_TEXTURE_MAG_FILTER, GL.GL_LINEAR)
@@ -19,17 +71,40 @@ class Cubemap:
 
 		except FileNotFoundError:
 			print("ERROR: unable to load texture file %s" % file)
-		GL.glBindTexture(GL.GL_TEXTURE_CUBE_MAP, 0)
+		state.bind_texture(GL.GL_TEXTURE_CUBE_MAP, 0)
 
 	def __load(self, files):
 		# https://www.khronos.org/registry/OpenGL-Refpages/gl4/html/glTexImage2D.xhtml
 		# https://learnopengl.com/Advanced-OpenGL/Cubemaps
-		i = 0
-		for file in files:
-			# imports image as a numpy array in exactly right format
-			tex = np.array(Image.open(file))
-			GL.glTexImage2D(GL.GL_TEXTURE_CUBE_MAP_POSITIVE_X + i, 0, GL.GL_RGB, tex.shape[1], tex.shape[0], 0, GL.GL_RGB, GL.GL_UNSIGNED_BYTE, tex)
-			i += 1
-
-	def __del__(self):  # delete GL texture from GPU when object dies
-		GL.glDeleteTextures(self.glid)
+		if self.compression:  # faces encoded concurrently once, cached next to each file
+			lock, cube = threading.Lock(), []  # decoded only if a face has to be encoded
+
+			def rgba(i):
+				with lock:
+					if not cube:
+						cube.append(load_cube(files))
+				face = cube[0][i]
+				alpha = np.full(face.shape[:2] + (1,), 255, np.uint8)
+				return [np.concatenate((face, alpha), axis=2) if face.shape[2] == 3 else face]
+
+			with ThreadPoolExecutor(max_workers=len(files)) as pool:
+				faces = list(pool.map(lambda i: compress_file(files[i], lambda: rgba(i), self.compression),
+									  range(len(files))))
+			for i, (fmt, [(width, height, data)]) in enumerate(faces):
+				GL.glCompressedTexImage2D(GL.GL_TEXTURE_CUBE_MAP_POSITIVE_X + i, 0, fmt, width, height, 0, data)
+			resources.resize(self.key, sum(data.nbytes for _, [(_, _, data)] in faces))
+			return
+
+		cube = load_cube(files)
+		_, height, width, channels = cube.shape
+		fmt = self.FORMATS[channels]
+		# rows of RGB faces are not 4 byte aligned in general, the GL default
+		alignment = GL.glGetIntegerv(GL.GL_UNPACK_ALIGNMENT)
+		GL.glPixelStorei(GL.GL_UNPACK_ALIGNMENT, 4 if width * channels % 4 == 0 else 1)
+		for i, face in enumerate(cube):
+			GL.glTexImage2D(GL.GL_TEXTURE_CUBE_MAP_POSITIVE_X + i, 0, fmt, width, height, 0, fmt, GL.GL_UNSIGNED_BYTE, face)
+		GL.glPixelStorei(GL.GL_UNPACK_ALIGNMENT, alignment)
+		resources.resize(self.key, cube.nbytes)
+
+	def release(self):  # delete GL texture from GPU at the end of the frame
+		resources.release(self.key)
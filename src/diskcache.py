@@ -0,0 +1,23 @@
+import os
+import hashlib
+
+# shared by all on disk caches: imported scenes, resource index, textures
+CACHE_DIR = os.environ.get('FANTASYLAND_CACHE',
+                           os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, '.cache'))
+
+
+def file_hash(file):
+    """ sha1 of the file content, read by chunks """
+    sha = hashlib.sha1()
+    with open(file, 'rb') as stream:
+        for chunk in iter(lambda: stream.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def stat_hash(file):
+    """ sha1 of the file path, size and modification time: cheaper than
+        file_hash for big files which are only replaced, never edited """
+    stat = os.stat(file)
+    key = '%s:%d:%d' % (os.path.abspath(file), stat.st_size, stat.st_mtime_ns)
+    return hashlib.sha1(key.encode()).hexdigest()
@@ -0,0 +1,47 @@
+import OpenGL.GL as GL
+import numpy as np
+
+from glresources import resources
+from light import Light
+from shader import BLOCK_BINDINGS
+
+# std140 layout of the FrameData uniform block declared by the shaders:
+# vec3 are 16 byte aligned, as is each element of a vec3 array
+FRAME_LAYOUT = np.dtype({
+    'names': ['view', 'projection', 'w_camera_position', 'color', 'light_position', 'atten_factor'],
+    'formats': [('<f4', (4, 4)), ('<f4', (4, 4)), ('<f4', 3), ('<f4', 3), ('<f4', (4, 4)), ('<f4', (4, 4))],
+    'offsets': [0, 64, 128, 144, 160, 224],
+    'itemsize': 288})
+
+
+# ------------  Uniforms constant over a frame, uploaded once per frame -----
+class FrameData:
+    """ Uniform buffer of the FrameData block: camera matrices and position,
+        fog color and lights, bound once for all shaders. Meshes then only
+        set their model matrix and material. """
+
+    def __init__(self, light=None):
+        self.light = light or Light()
+        self.data = np.zeros(1, FRAME_LAYOUT)
+        self.glid = GL.glGenBuffers(1)
+        self.key = resources.track('buffer', self.glid, self, FRAME_LAYOUT.itemsize, 'uniform buffer')
+        GL.glBindBuffer(GL.GL_UNIFORM_BUFFER, self.glid)
+        GL.glBufferData(GL.GL_UNIFORM_BUFFER, FRAME_LAYOUT.itemsize, None, GL.GL_DYNAMIC_DRAW)
+        GL.glBindBuffer(GL.GL_UNIFORM_BUFFER, 0)
+        GL.glBindBufferBase(GL.GL_UNIFORM_BUFFER, BLOCK_BINDINGS['FrameData'], self.glid)
+
+    def update(self, view, projection):
+        """ fill the block for a frame seen through view and projection """
+        data = self.data[0]
+        data['view'] = np.transpose(view)  # GLSL matrices are column major
+        data['projection'] = np.transpose(projection)
+        data['w_camera_position'] = np.linalg.inv(view)[:3, 3]
+        data['color'] = self.light.get_color()
+        data['light_position'][:, :3] = self.light.light_pos
+        data['atten_factor'][:, :3] = self.light.light_atten
+        GL.glBindBuffer(GL.GL_UNIFORM_BUFFER, self.glid)
+        GL.glBufferSubData(GL.GL_UNIFORM_BUFFER, 0, FRAME_LAYOUT.itemsize, self.data)
+        GL.glBindBuffer(GL.GL_UNIFORM_BUFFER, 0)
+
+    def release(self):
+        resources.release(self.key)
@@ -0,0 +1,131 @@
+import threading
+import weakref
+from collections import defaultdict
+from contextlib import contextmanager
+
+import OpenGL.GL as GL
+
+from glstate import state
+
+# batched delete call of each kind of GL object
+DELETERS = {'texture': lambda ids: GL.glDeleteTextures(len(ids), ids),
+            'buffer': lambda ids: GL.glDeleteBuffers(len(ids), ids),
+            'vertex array': lambda ids: GL.glDeleteVertexArrays(len(ids), ids),
+            'program': lambda ids: [GL.glDeleteProgram(glid) for glid in ids]}
+
+
+# ------------  Lifetime and memory accounting of GL objects ----------------
+class ResourceManager:
+    """ Tracks every GL object with its byte size, category and owner.
+        Objects are freed when their owner calls release(), when the scope
+        they were created in ends, or when their owner is garbage collected.
+        None of these call GL: deletes are deferred to collect(), which the
+        viewer calls once per frame while its context is current, so they
+        can happen at any time, from any thread, even after the context is
+        gone. """
+
+    def __init__(self):
+        self.live = {}  # (kind, glid) -> [category, bytes, owner description]
+        self.finalizers = {}  # (kind, glid) -> weakref.finalize on its owner
+        self.pending = []  # (kind, glid) released, to delete in collect()
+        self.scopes = []  # lists of the keys tracked in each open scope
+        self.closers = []  # functions stopping users of the objects, see at_shutdown
+        self.lock = threading.Lock()
+
+    def track(self, kind, glid, owner, nbytes=0, category=None, label=None):
+        """ start tracking GL object glid of kind (see DELETERS), released
+            along with owner at the latest; returns its key """
+        key = (kind, int(glid))
+        description = type(owner).__name__ + (' %s' % label if label else '')
+        with self.lock:
+            self.live[key] = [category or kind, nbytes, description]
+            self.finalizers[key] = weakref.finalize(owner, self._defer, key)
+            if self.scopes:
+                self.scopes[-1].append(key)
+        return key
+
+    def resize(self, key, nbytes):
+        """ update the GPU memory held by a tracked object """
+        with self.lock:
+            if key in self.live:
+                self.live[key][1] = nbytes
+
+    def release(self, *keys):
+        """ free tracked objects at the next collect(), idempotent; they
+            count as resident until then """
+        for key in keys:
+            finalizer = self.finalizers.get(key)
+            if finalizer:
+                finalizer()  # runs _defer once, detaches from the owner
+
+    def _defer(self, key):
+        # no lock: finalizers may run from garbage collection at any point
+        self.pending.append(key)
+
+    @contextmanager
+    def scope(self):
+        """ objects tracked inside the with block are released at its end """
+        with self.lock:
+            self.scopes.append([])
+        try:
+            yield
+        finally:
+            with self.lock:
+                keys = self.scopes.pop()
+            self.release(*keys)
+
+    def collect(self):
+        """ delete released objects, only with a current GL context """
+        with self.lock:
+            pending, self.pending = self.pending, []
+            ids = defaultdict(list)
+            for key in pending:
+                self.finalizers.pop(key, None)
+                if self.live.pop(key, None) is not None:
+                    ids[key[0]].append(key[1])
+        for kind, glids in ids.items():
+            DELETERS[kind](glids)
+            state.deleted(kind, glids)
+        return sum(len(glids) for glids in ids.values())
+
+    def at_shutdown(self, close):
+        """ have shutdown() call close() first, e.g. to stop a background
+            thread preparing data for GL objects """
+        with self.lock:
+            self.closers.append(close)
+
+    def shutdown(self):
+        """ stop the registered users then delete every object while the
+            context is still current """
+        with self.lock:
+            closers, self.closers = self.closers, []
+        for close in closers:
+            close()
+        self.release(*list(self.live))
+        self.collect()
+
+    def resident(self):
+        """ {category: (objects, bytes)} of the tracked objects """
+        usage = defaultdict(lambda: (0, 0))
+        with self.lock:
+            for category, nbytes, _ in list(self.live.values()):
+                count, total = usage[category]
+                usage[category] = count + 1, total + nbytes
+        return dict(usage)
+
+    def resident_bytes(self, category=None):
+        """ GPU memory held by tracked objects, of one category or all """
+        return sum(nbytes for name, (_, nbytes) in self.resident().items() if category in (None, name))
+
+    def report(self):
+        """ printable table of the resident memory and the largest objects """
+        lines = ['%-14s %6d objects %10.1f MiB' % (category, count, nbytes / (1 << 20))
+                 for category, (count, nbytes) in sorted(self.resident().items())]
+        with self.lock:
+            largest = sorted(self.live.values(), key=lambda entry: -entry[1])[:5]
+        lines += ['  %-12s %10.1f MiB  %s' % (category, nbytes / (1 << 20), owner)
+                  for category, nbytes, owner in largest]
+        return '\n'.join(lines)
+
+
+resources = ResourceManager()
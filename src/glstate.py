@@ -0,0 +1,140 @@
+import os
+
+import OpenGL.GL as GL
+
+# glGet query of the texture bound to each target of the active unit
+TEXTURE_BINDINGS = {GL.GL_TEXTURE_2D: GL.GL_TEXTURE_BINDING_2D,
+                    GL.GL_TEXTURE_CUBE_MAP: GL.GL_TEXTURE_BINDING_CUBE_MAP}
+
+
+# ------------  Cache of the GL state, skipping redundant calls -------------
+class GLState:
+    """ Tracks the current program, vertex array, texture bindings per unit
+        and target, depth function, viewport and enabled capabilities, so that
+        setting one to its current value makes no GL call. All changes of
+        this state must go through it, or be followed by invalidate().
+        Each setter returns whether it made a GL call. In debug mode, set
+        by FANTASYLAND_GL_DEBUG=1, every setter first checks the cache
+        against glGet values and raises AssertionError on a mismatch. """
+
+    def __init__(self, debug=None):
+        self.debug = bool(os.environ.get('FANTASYLAND_GL_DEBUG')) if debug is None else debug
+        self.calls = self.skipped = 0
+        self.invalidate()
+
+    def invalidate(self):
+        """ forget the cached state, e.g. after raw GL calls changing it """
+        self.program = self.vertex_array = self.unit = self.depth = self.viewport = None
+        self.textures = {}  # (unit, target) -> texture glid
+        self.capabilities = {}  # capability -> enabled
+
+    def _changed(self, changed):
+        if changed:
+            self.calls += 1
+        else:
+            self.skipped += 1
+        return changed
+
+    def use_program(self, glid):
+        """ glUseProgram """
+        if self.debug:
+            self.validate()
+        if self.program != glid:
+            GL.glUseProgram(glid)
+            self.program = glid
+            return self._changed(True)
+        return self._changed(False)
+
+    def bind_vertex_array(self, glid):
+        """ glBindVertexArray """
+        if self.debug:
+            self.validate()
+        if self.vertex_array != glid:
+            GL.glBindVertexArray(glid)
+            self.vertex_array = glid
+            return self._changed(True)
+        return self._changed(False)
+
+    def bind_texture(self, target, glid, unit=0):
+        """ glBindTexture on a texture unit, made active if needed """
+        if self.debug:
+            self.validate()
+        if self.textures.get((unit, target)) != glid:
+            if self.unit != unit:
+                GL.glActiveTexture(GL.GL_TEXTURE0 + unit)
+                self.unit = unit
+            GL.glBindTexture(target, glid)
+            self.textures[unit, target] = glid
+            return self._changed(True)
+        return self._changed(False)
+
+    def depth_func(self, func):
+        """ glDepthFunc """
+        if self.debug:
+            self.validate()
+        if self.depth != func:
+            GL.glDepthFunc(func)
+            self.depth = func
+            return self._changed(True)
+        return self._changed(False)
+
+    def set_viewport(self, x, y, width, height):
+        """ glViewport """
+        if self.debug:
+            self.validate()
+        if self.viewport != (x, y, width, height):
+            GL.glViewport(x, y, width, height)
+            self.viewport = (x, y, width, height)
+            return self._changed(True)
+        return self._changed(False)
+
+    def get_viewport(self):
+        """ (x, y, width, height) of the viewport, queried only if unknown """
+        if self.viewport is None:
+            self.viewport = tuple(int(value) for value in GL.glGetIntegerv(GL.GL_VIEWPORT))
+        return self.viewport
+
+    def enable(self, capability, enabled=True):
+        """ glEnable or glDisable, e.g. GL_CULL_FACE and GL_DEPTH_TEST """
+        if self.debug:
+            self.validate()
+        if self.capabilities.get(capability) != enabled:
+            (GL.glEnable if enabled else GL.glDisable)(capability)
+            self.capabilities[capability] = enabled
+            return self._changed(True)
+        return self._changed(False)
+
+    def deleted(self, kind, glids):
+        """ GL unbinds deleted textures and vertex arrays, see glresources """
+        glids = set(glids)
+        if kind == 'vertex array' and self.vertex_array in glids:
+            self.vertex_array = 0
+        elif kind == 'texture':
+            for key, glid in self.textures.items():
+                if glid in glids:
+                    self.textures[key] = 0
+
+    def validate(self):
+        """ assert that the cached state is the actual GL state """
+        mismatches = []
+
+        def check(name, cached, actual):
+            if cached is not None and cached != actual:
+                mismatches.append('%s: cached %s, actual %s' % (name, cached, actual))
+
+        check('program', self.program, GL.glGetIntegerv(GL.GL_CURRENT_PROGRAM))
+        check('vertex array', self.vertex_array, GL.glGetIntegerv(GL.GL_VERTEX_ARRAY_BINDING))
+        check('depth function', self.depth, GL.glGetIntegerv(GL.GL_DEPTH_FUNC))
+        check('viewport', self.viewport, tuple(int(value) for value in GL.glGetIntegerv(GL.GL_VIEWPORT)))
+        for capability, enabled in self.capabilities.items():
+            check('capability %s' % capability, enabled, bool(GL.glIsEnabled(capability)))
+        active = GL.glGetIntegerv(GL.GL_ACTIVE_TEXTURE) - GL.GL_TEXTURE0
+        check('active texture unit', self.unit, active)
+        for (unit, target), glid in self.textures.items():
+            GL.glActiveTexture(GL.GL_TEXTURE0 + unit)
+            check('texture unit %d target %s' % (unit, target), glid, GL.glGetIntegerv(TEXTURE_BINDINGS[target]))
+        GL.glActiveTexture(GL.GL_TEXTURE0 + active)
+        assert not mismatches, 'GL state cache out of date:\n' + '\n'.join(mismatches)
+
+
+state = GLState()
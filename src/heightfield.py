@@ -0,0 +1,96 @@
+import os
+import math
+
+import numpy as np
+from PIL import Image
+
+HEIGHTMAP = '../resources/hmap.png'
+ORIGIN = (-300.0, -300.0)  # world (x, z) of the first heightmap texel
+EXTENT = 1000.0  # world size of the terrain along x and z
+HEIGHT_SCALE = 100.0  # world height of a texel of value 256
+
+
+# ------------  Terrain heights shared by the terrain, camera and props -----
+class HeightField:
+    """ Heightmap placed in world space like the terrain: sample (i, j) is
+        the terrain vertex at x = origin[0] + j * spacing, z = origin[1] +
+        i * spacing, at height samples[i, j] * scale. Heights and normals
+        are bilinearly interpolated between samples, positions outside
+        the map being clamped. Samples may be memory mapped, only the ones
+        queried are then read. """
+
+    def __init__(self, samples, scale, origin=ORIGIN, spacing=1.0):
+        self.samples = samples
+        self.scale = scale
+        self.size = samples.shape[0]
+        self.origin = np.asarray(origin, np.float64)
+        self.spacing = spacing
+
+    @classmethod
+    def from_image(cls, file, origin=ORIGIN, extent=EXTENT):
+        """ heightmap decoded from the red channel of an image, spanning
+            extent world units; the decoded image is kept as self.image """
+        image = np.asarray(Image.open(file).convert('RGB'))
+        field = cls(image[:, :, 0], HEIGHT_SCALE / 256, origin, extent / (image.shape[0] - 1))
+        field.image = image
+        return field
+
+    @classmethod
+    def from_raw(cls, file, size=None, origin=ORIGIN, spacing=1.0, height_scale=HEIGHT_SCALE):
+        """ square heightmap of little endian uint16 samples, memory mapped
+            from a headerless file, its side deduced from the file size """
+        size = size or math.isqrt(os.path.getsize(file) // 2)
+        samples = np.memmap(file, '<u2', mode='r', shape=(size, size))
+        return cls(samples, height_scale / 65536, origin, spacing)
+
+    def _cells(self, positions):
+        """ (N, 2) world x, z to the sample rows, columns of the top left
+            corners of their cells and the fractions inside them """
+        texels = (np.asarray(positions, np.float64).reshape(-1, 2) - self.origin)[:, ::-1] / self.spacing
+        texels = np.clip(texels, 0, self.size - 1)
+        corners = np.minimum(texels.astype(np.int64), self.size - 2)
+        return corners[:, 0], corners[:, 1], texels - corners
+
+    def _heights(self, rows, cols):
+        return self.samples[rows, cols] * self.scale
+
+    def heights_at(self, positions):
+        """ (N,) heights of the terrain at the (N, 2) world x, z positions """
+        rows, cols, fractions = self._cells(positions)
+        fz, fx = fractions[:, 0], fractions[:, 1]
+        h00, h01 = self._heights(rows, cols), self._heights(rows, cols + 1)
+        h10, h11 = self._heights(rows + 1, cols), self._heights(rows + 1, cols + 1)
+        top = h00 * (1 - fx) + h01 * fx
+        bottom = h10 * (1 - fx) + h11 * fx
+        return top * (1 - fz) + bottom * fz
+
+    def normals_at(self, positions):
+        """ (N, 3) unit normals of the bilinear surface at (N, 2) x, z """
+        rows, cols, fractions = self._cells(positions)
+        fz, fx = fractions[:, 0], fractions[:, 1]
+        h00, h01 = self._heights(rows, cols), self._heights(rows, cols + 1)
+        h10, h11 = self._heights(rows + 1, cols), self._heights(rows + 1, cols + 1)
+        dx = (h01 - h00) * (1 - fz) + (h11 - h10) * fz
+        dz = (h10 - h00) * (1 - fx) + (h11 - h01) * fx
+        normals = np.stack((-dx, np.full_like(dx, self.spacing), -dz), axis=1)
+        return normals / np.linalg.norm(normals, axis=1, keepdims=True)
+
+    def height(self, x, z):
+        """ height of the terrain at world x, z """
+        return float(self.heights_at((x, z))[0])
+
+    def normal(self, x, z):
+        """ unit normal of the terrain at world x, z """
+        return self.normals_at((x, z))[0]
+
+
+_fields = {}
+
+
+def load_heightfield(file=HEIGHTMAP):
+    """ shared HeightField of an image or .raw file, loaded on first use """
+    key = os.path.normcase(os.path.abspath(file))
+    if key not in _fields:
+        raw = file.lower().endswith('.raw')
+        _fields[key] = HeightField.from_raw(file) if raw else HeightField.from_image(file)
+    return _fields[key]
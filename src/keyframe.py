@@ -5,6 +5,7 @@ from node import Node
 from transform import rotate, translate, scale
 from bisect import bisect_left
 from transform import (quaternion_slerp, quaternion_matrix, lerp)
+from transform import quaternion_slerp_batch, trs_batch
                        
 class KeyFrames:
     """ Stores keyframe pairs for any value type with interpolation_function"""
@@ -53,6 +54,55 @@ class TransformKeyFrames:
         return T @ R @ S
 
 
+class KeyFramesBatch:
+    """ N KeyFrames of values of a given size, evaluated at once at one
+        time per row, with the same results as their value() """
+
+    def __init__(self, keyframes, size, interpolation_function=lerp):
+        # key times padded with inf, values with the last key's, per row;
+        # at least 2 columns, the pair interpolated in value() always exists
+        self.lengths = np.array([len(keys.times) for keys in keyframes])
+        self.times = np.full((len(keyframes), max(self.lengths.max(), 2)), np.inf)
+        self.values = np.empty(self.times.shape + (size,), 'f')
+        for row, (keys, length) in enumerate(zip(keyframes, self.lengths)):
+            self.times[row, :length] = keys.times
+            self.values[row, :length] = np.reshape(keys.values, (length, -1))  # scalars broadcast
+            self.values[row, length:] = self.values[row, length - 1]
+        self.rows = np.arange(len(keyframes))
+        self.interpolate = interpolation_function
+
+    def value(self, times):
+        """ (N, size) interpolated values, times (N,) """
+        rows, lengths = self.rows, self.lengths
+        index = (self.times < times[:, None]).sum(axis=1)  # bisect_left per row
+        index = np.clip(index, 1, np.maximum(lengths - 1, 1))
+        before, after = self.times[rows, index - 1], self.times[rows, index]
+        fraction = ((times - before) / (after - before)).astype('f')
+        values = self.interpolate(self.values[rows, index], self.values[rows, index - 1],
+                                  fraction if self.interpolate is not lerp else fraction[:, None])
+
+        # boundary keyframes outside of the key times, as KeyFrames.value
+        first, last = times <= self.times[:, 0], times >= self.times[rows, lengths - 1]
+        values[first] = self.values[first, 0]
+        values[last] = self.values[rows, lengths - 1][last]
+        return values
+
+
+class TransformKeyFramesBatch:
+    """ TransformKeyFrames of N nodes evaluated at once, see KeyFramesBatch """
+
+    def __init__(self, keyframes):
+        self.translate_keys = KeyFramesBatch([keys.translate_keys for keys in keyframes], 3)
+        self.rotate_keys = KeyFramesBatch([keys.rotate_keys for keys in keyframes], 4,
+                                          interpolation_function=quaternion_slerp_batch)
+        self.scale_keys = KeyFramesBatch([keys.scale_keys for keys in keyframes], 3)
+
+    def value(self, times, out=None):
+        """ (N, 4, 4) TRS matrices at times (N,), written to out if given """
+        return trs_batch(self.translate_keys.value(times), self.rotate_keys.value(times),
+                         self.scale_keys.value(times), out)
+
+
 class KeyFrameControlNode(Node):
     """ Place node with transform keys above a controlled subtree """
 
@@ -60,8 +110,18 @@ class KeyFrameControlNode(Node):
         super().__init__()
         self.keyframes = TransformKeyFrames(translate_keys, rotate_keys, scale_keys)
 
+    def interpolate(self):
+        """ interpolate our node transform from keys, see TransformStore """
+        self.transform = self.keyframes.value(glfw.get_time())
+
     def draw(self, projection, view, model):
         """ When redraw requested, interpolate our node transform from keys """
-        time = glfw.get_time()
-        self.transform = self.keyframes.value(time)
+        if self.store is None:
+            self.interpolate()
         super().draw(projection, view, model)
+
+    def submit(self, queue, model):
+        """ same interpolation as draw() before queuing the subtree """
+        if self.store is None:
+            self.interpolate()
+        super().submit(queue, model)
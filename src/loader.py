@@ -0,0 +1,55 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from assetcache import cache_scene
+from registry import registry
+from texture import load_mip_chain
+
+
+# ------------  Parallel asset import, GL upload on the calling thread -------
+class AssetLoader:
+    """ Imports scenes in worker processes and decodes textures in worker
+        threads. Workers only produce CPU side payloads: upload() then turns
+        all of them into shared VertexArray and Texture objects in a single
+        pass, on the thread owning the GL context. """
+
+    def __init__(self, workers=None):
+        self.workers = workers or os.cpu_count()
+        # workers are started on demand, while decoder threads run and a GL
+        # context exists: forking this process then could deadlock them
+        self.processes = ProcessPoolExecutor(max_workers=self.workers,
+                                             mp_context=multiprocessing.get_context('forkserver'))
+        self.threads = ThreadPoolExecutor(max_workers=self.workers)
+        self.scenes = {}  # (file, flags) -> future of its cache directory, None if failed
+        self.images = {}  # texture file -> future of its mip chain, cooked if needed
+
+    def prefetch(self, file, flags, tex_files=()):
+        """ start importing file and decoding its textures in the background """
+        if (file, flags) not in self.scenes:
+            self.scenes[file, flags] = self.processes.submit(cache_scene, file, flags)
+        for tex_file in tex_files:
+            if tex_file not in self.images:
+                self.images[tex_file] = self.threads.submit(load_mip_chain, tex_file)
+
+    def upload(self):
+        """ wait for all payloads and upload them to the GPU, in one pass """
+        for (file, flags), imported in self.scenes.items():
+            try:
+                path = imported.result()
+            except Exception as exception:  # e.g. a worker process died
+                print('ERROR loading', file + ': ', exception)
+                path = None
+            scene = registry.scene(file, flags, path) if path else registry.failed(file, flags)
+            for mesh_id, mesh in enumerate(scene.meshes if scene else ()):
+                registry.vertex_array(file, flags, mesh_id, mesh)
+
+        for tex_file, levels in self.images.items():
+            try:
+                registry.texture(tex_file, levels.result())
+            except FileNotFoundError:
+                registry.texture(tex_file)  # reports the missing file
+
+        self.scenes, self.images = {}, {}
+        self.processes.shutdown()
+        self.threads.shutdown()
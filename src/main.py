@@ -1,11 +1,15 @@
 #!/usr/bin/env python3
 
+import sys
+import time
 import glfw
 from viewer import Viewer
 from skybox import Skybox
 from shader import Shader
-from textureground import groundNode
-from core import add_animation, add_objects
+from terrain import groundNode
+from heightfield import HEIGHTMAP, load_heightfield
+from core import add_animation, add_objects, preload
+from loader import AssetLoader
 
 
 def main():
@@ -20,15 +24,26 @@ def main():
         '../resources/skybox/bk.jpg']
 
     phong_shader = Shader("shaders/phong.vert", "shaders/phong.frag")
+    instanced_shader = Shader("shaders/phong_instanced.vert", "shaders/phong.frag")
     skinning_shader = Shader("shaders/skinning.vert", "shaders/skinning.frag")
     terrain_shader = Shader("shaders/ground.vert", "shaders/ground.frag")
 
+    start = time.perf_counter()
+    preload(AssetLoader())
     add_animation(viewer, shader=skinning_shader)
-    add_objects(viewer, shader=phong_shader)
-    groundNode(viewer, shader=terrain_shader)
+    add_objects(viewer, shader=phong_shader, instanced_shader=instanced_shader)
+    print('Assets loaded in %.2fs' % (time.perf_counter() - start))
 
+    # a .raw heightmap given on the command line is streamed around the camera
+    heightmap = sys.argv[1] if len(sys.argv) > 1 else HEIGHTMAP
+    viewer.camera.heightfield = load_heightfield(heightmap)
+    start = time.perf_counter()
+    groundNode(viewer, shader=terrain_shader, heightmapFile=heightmap)
+    print('Terrain generated in %.2fs' % (time.perf_counter() - start))
 
-    viewer.add(Skybox(field))
+    start = time.perf_counter()
+    viewer.add(Skybox(field, compression='fast'))
+    print('Skybox loaded in %.2fs' % (time.perf_counter() - start))
 
     print("""
     Hi and welcome to our FantasyLand!
@@ -45,6 +60,7 @@ def main():
     Left arrow: Move camera to the left
     Shift (works with all the buttons): Makes movements of all previous keys faster
     Spacebar to reset all animations
+    I: print the draw calls, state changes and world transforms of the last frame
     ESC or Q to exit the land
     
     """)
@@ -1,10 +1,12 @@
+import ctypes
+
 import OpenGL.GL as GL
 import numpy as np
 
+from glresources import resources
+from glstate import state
 from vertexarray import VertexArray
 from node import Node
-from light import Light
-color = Light()
 
 # ------------  Mesh is a core drawable, can be basis for most objects --------
 class Mesh:
@@ -12,30 +14,31 @@ class Mesh:
 
     def __init__(self, shader, attributes, index=None):
         self.shader = shader
-        self.names = ['view', 'projection', 'model']
-        self.loc = {n: GL.glGetUniformLocation(shader.glid, n) for n in self.names}
         self.vertex_array = VertexArray(attributes, index)
 
     def draw(self, projection, view, model, primitives=GL.GL_TRIANGLES):
-        GL.glUseProgram(self.shader.glid)
-
-        GL.glUniformMatrix4fv(self.loc['view'], 1, True, view)
-        GL.glUniformMatrix4fv(self.loc['projection'], 1, True, projection)
-        GL.glUniformMatrix4fv(self.loc['model'], 1, True, model)
+        state.use_program(self.shader.glid)
+        self.shader.set_uniforms(view=view, projection=projection, model=model)
 
         # draw triangle as GL_TRIANGLE vertex array, draw array call
         self.vertex_array.execute(primitives)
 
 
 # -------------- Texture based Phong rendered Mesh class -------------------------
+def material(mesh):
+    """ uniforms of the textured phong shaders, skinned or not, besides
+        model and the frame constants of framedata.py """
+    return dict(k_a=mesh.k_a, k_d=mesh.k_d, k_s=mesh.k_s, s=max(mesh.s, 0.001), diffuse_map=0)
+
 
 class TexturedPhongMesh(Node):
     def __init__(self, shader, tex, attributes, faces,
                  light_dir=None, k_a=(1, 1, 1), k_d=(1, 1, 0), k_s=(1, 1, 0),
-                 s=64.):
+                 s=64., vertex_array=None):
         super().__init__()
         self.texture = tex
-        self.vertex_array = VertexArray(attributes=attributes, index=faces)
+        # geometry may be shared with other meshes, see registry.py
+        self.vertex_array = vertex_array or VertexArray(attributes=attributes, index=faces)
         self.shader = shader
 
         self.k_a = k_a
@@ -44,49 +47,23 @@ class TexturedPhongMesh(Node):
         self.s = s
 
     def draw(self, projection, view, model, primitives=GL.GL_TRIANGLES):
-        GL.glUseProgram(self.shader.glid)
-
-        names = ['view', 'projection', 'model',
-                 'diffuseMap', 'k_a', 'k_d', 'k_s', 's',
-                 'color', 'w_camera_position']
-        loc = {n: GL.glGetUniformLocation(self.shader.glid, n) for n in names}
-
-        for i in range(0, color.num_light_src):
-            light_pos_loc = GL.glGetUniformLocation(self.shader.glid, 'light_position[%d]' % i)
-            GL.glUniform3fv(light_pos_loc, 1, color.light_pos[i])
-
-            atten_loc = GL.glGetUniformLocation(self.shader.glid, 'atten_factor[%d]' % i)
-            GL.glUniform3fv(atten_loc, 1, color.light_atten[i])
-
-        GL.glUniformMatrix4fv(loc['view'], 1, True, view)
-        GL.glUniformMatrix4fv(loc['projection'], 1, True, projection)
-        GL.glUniformMatrix4fv(loc['model'], 1, True, model)
+        state.use_program(self.shader.glid)
+        self.shader.set_uniforms(model=model, **material(self))
 
-        GL.glUniform3fv(loc['k_a'], 1, self.k_a)
-        GL.glUniform3fv(loc['k_d'], 1, self.k_d)
-        GL.glUniform3fv(loc['k_s'], 1, self.k_s)
-        GL.glUniform1f(loc['s'], max(self.s, 0.001))
-        GL.glUniform3fv(loc['color'], 1, color.get_color())
-
-        w_camera_position = np.linalg.inv(view)[:, 3]
-        GL.glUniform3fv(loc['w_camera_position'], 1, w_camera_position)
-
-        GL.glActiveTexture(GL.GL_TEXTURE0)
-        GL.glBindTexture(GL.GL_TEXTURE_2D, self.texture.glid)
-        GL.glUniform1i(loc['diffuseMap'], 0)
+        state.bind_texture(GL.GL_TEXTURE_2D, self.texture.glid)
         self.vertex_array.execute(primitives)
 
-        GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
-        GL.glUseProgram(0)
+    def submit(self, queue, model):
+        queue.add(self.shader, self.vertex_array, model, self.texture, **material(self))
 
 
 class TexturedPhongMeshSkinned(Node):
     def __init__(self, shader, tex, attributes, faces, bone_nodes, bone_offsets,
-                 k_a=(1, 1, 1), k_d=(1, 1, 0), k_s=(1, 1, 0), s=64.):
+                 k_a=(1, 1, 1), k_d=(1, 1, 0), k_s=(1, 1, 0), s=64., vertex_array=None):
         super().__init__()
 
         self.texture = tex
-        self.vertex_array = VertexArray(attributes=attributes, index=faces)
+        self.vertex_array = vertex_array or VertexArray(attributes=attributes, index=faces)
         self.shader = shader
 
         self.k_a = k_a
@@ -96,45 +73,161 @@ class TexturedPhongMeshSkinned(Node):
 
         self.bone_nodes = bone_nodes
         self.bone_offsets = np.array(bone_offsets, np.float32)
+        self.bone_store = self.bone_rows = None  # TransformStore rows of the bones
 
     def draw(self, projection, view, model, primitives=GL.GL_TRIANGLES):
-        GL.glUseProgram(self.shader.glid)
-
-        names = ['view', 'projection', 'model', 'diffuseMap', 'k_a', 'k_d', 'k_s', 's',
-                 'color', 'w_camera_position']
-        loc = {n: GL.glGetUniformLocation(self.shader.glid, n) for n in names}
-
-        GL.glUniformMatrix4fv(loc['view'], 1, True, view)
-        GL.glUniformMatrix4fv(loc['projection'], 1, True, projection)
-        GL.glUniformMatrix4fv(loc['model'], 1, True, model)
-
-        GL.glUniform3fv(loc['k_a'], 1, self.k_a)
-        GL.glUniform3fv(loc['k_d'], 1, self.k_d)
-        GL.glUniform3fv(loc['k_s'], 1, self.k_s)
-        GL.glUniform1f(loc['s'], max(self.s, 0.001))
-        GL.glUniform3fv(loc['color'], 1, color.get_color())
-
-        for bone_id, node in enumerate(self.bone_nodes):
-            bone_matrix = node.world_transform @ self.bone_offsets[bone_id]
+        state.use_program(self.shader.glid)
+        self.shader.set_uniforms(model=model, bone_matrix=self.bone_matrix(), **material(self))
 
-            bone_loc = GL.glGetUniformLocation(self.shader.glid, 'bone_matrix[%d]' % bone_id)
-            GL.glUniformMatrix4fv(bone_loc, len(self.bone_nodes), True, bone_matrix)
-
-        for i in range(0, color.num_light_src):
-            light_pos_loc = GL.glGetUniformLocation(self.shader.glid, 'light_position[%d]' % i)
-            GL.glUniform3fv(light_pos_loc, 1, color.light_pos[i])
-
-            atten_loc = GL.glGetUniformLocation(self.shader.glid, 'atten_factor[%d]' % i)
-            GL.glUniform3fv(atten_loc, 1, color.light_atten[i])
+        state.bind_texture(GL.GL_TEXTURE_2D, self.texture.glid)
+        self.vertex_array.execute(primitives)
 
-        w_camera_position = np.linalg.inv(view)[:, 3]
-        GL.glUniform3fv(loc['w_camera_position'], 1, w_camera_position)
+    def bone_matrix(self):
+        """ skinning matrices of the bones, from their current pose, one
+            gather of rows when the bones share a TransformStore """
+        store = getattr(self.bone_nodes[0], 'store', None) if self.bone_nodes else None
+        if store is not self.bone_store:
+            self.bone_store = store
+            shared = store is not None and all(getattr(node, 'store', None) is store for node in self.bone_nodes)
+            self.bone_rows = np.array([node.row for node in self.bone_nodes]) if shared else None
+        if self.bone_rows is not None:
+            return store.world[self.bone_rows] @ self.bone_offsets
+        world_transforms = [node.world_transform for node in self.bone_nodes]
+        return world_transforms @ self.bone_offsets
+
+    def submit(self, queue, model):
+        queue.add(self.shader, self.vertex_array, model, self.texture,
+                  bone_matrix=self.bone_matrix(), **material(self))
+
+
+# -------------- Instanced Phong Mesh, one draw call for all placements -------
+# per instance attributes read by shaders/phong_instanced.vert from location
+# INSTANCE_LOCATION: model matrix, column major as GLSL, one location per
+# column, then the tint multiplying the texture color
+INSTANCE_LAYOUT = np.dtype([('model', '<f4', (4, 4)), ('tint', '<f4', 4)])
+INSTANCE_LOCATION = 5
+
+
+class InstancedMesh(Node):
+    """ Textured phong mesh drawn at many placements with a single instanced
+        draw call: their model matrices and tints are rows of an instance
+        buffer, on top of the model matrix of the mesh's parent nodes.
+        Instances are added, moved and removed by id; only the rows changed
+        since the last draw are uploaded, and the buffer is reallocated
+        only when full, doubling its capacity. """
+
+    def __init__(self, shader, tex, attributes, faces, k_a=(1, 1, 1), k_d=(1, 1, 0), k_s=(1, 1, 0),
+                 s=64., vertex_array=None, capacity=16):
+        super().__init__()
+        self.texture = tex
+        # own vertex array object over the shared geometry, holding the
+        # instance attributes in addition to the vertex ones
+        vertex_array = vertex_array or VertexArray(attributes=attributes, index=faces)
+        self.vertex_array = vertex_array.share()
+        self.shader = shader
 
-        GL.glActiveTexture(GL.GL_TEXTURE0)
-        GL.glBindTexture(GL.GL_TEXTURE_2D, self.texture.glid)
-        GL.glUniform1i(loc['diffuseMap'], 0)
-        self.vertex_array.execute(primitives)
+        self.k_a = k_a
+        self.k_d = k_d
+        self.k_s = k_s
+        self.s = s
 
-        GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
-        GL.glUseProgram(0)
+        self.instances = np.zeros(capacity, INSTANCE_LAYOUT)
+        self.count = 0
+        self.ids = []  # instance id per row
+        self.rows = {}  # instance id -> row
+        self.next_id = 0
+        self.dirty = None  # (first, end) rows to upload
+        self.buffer = GL.glGenBuffers(1)
+        self.key = resources.track('buffer', self.buffer, self, self.instances.nbytes, 'instance buffer')
+        self._allocate()
+
+        state.bind_vertex_array(self.vertex_array.glid)
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.buffer)
+        stride = INSTANCE_LAYOUT.itemsize
+        for column in range(4):
+            self._instance_pointer(INSTANCE_LOCATION + column, stride, 16 * column)
+        self._instance_pointer(INSTANCE_LOCATION + 4, stride, INSTANCE_LAYOUT.fields['tint'][1])
+
+    @staticmethod
+    def _instance_pointer(loc, stride, offset):
+        """ vec4 attribute of bound vbo, advancing once per instance """
+        GL.glEnableVertexAttribArray(loc)
+        GL.glVertexAttribPointer(loc, 4, GL.GL_FLOAT, False, stride, ctypes.c_void_p(offset))
+        GL.glVertexAttribDivisor(loc, 1)
+
+    def _allocate(self):
+        """ (re)allocate the buffer storage to capacity, upload all rows """
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.buffer)
+        GL.glBufferData(GL.GL_ARRAY_BUFFER, self.instances, GL.GL_DYNAMIC_DRAW)
+        resources.resize(self.key, self.instances.nbytes)
+        self.dirty = None
+
+    def _touch(self, row):
+        first, end = self.dirty or (row, row + 1)
+        self.dirty = (min(first, row), max(end, row + 1))
+
+    def add_instance(self, transform, tint=(1, 1, 1, 1)):
+        """ draw the mesh with one more model matrix, return its id """
+        if self.count == len(self.instances):
+            self.instances = np.resize(self.instances, 2 * len(self.instances))
+            self.instances[self.count:] = 0
+            self._allocate()
+        row, instance_id = self.count, self.next_id
+        self.instances[row] = (np.transpose(transform), tint)
+        self.ids.append(instance_id)
+        self.rows[instance_id] = row
+        self.count += 1
+        self.next_id += 1
+        self._touch(row)
+        return instance_id
+
+    def move_instance(self, instance_id, transform, tint=None):
+        """ new model matrix, and optionally tint, of an instance """
+        row = self.rows[instance_id]
+        self.instances[row]['model'] = np.transpose(transform)
+        if tint is not None:
+            self.instances[row]['tint'] = tint
+        self._touch(row)
+
+    def remove_instance(self, instance_id):
+        """ stop drawing an instance: the last row takes its place """
+        row, last = self.rows.pop(instance_id), self.count - 1
+        if row != last:
+            self.instances[row] = self.instances[last]
+            self.ids[row] = self.ids[last]
+            self.rows[self.ids[row]] = row
+            self._touch(row)
+        self.ids.pop()
+        self.count -= 1
+
+    def _upload(self):
+        """ glBufferSubData of the rows changed since the last upload """
+        if self.dirty is not None:
+            first, end = self.dirty
+            end = min(end, self.count)
+            if first < end:
+                GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.buffer)
+                GL.glBufferSubData(GL.GL_ARRAY_BUFFER, first * INSTANCE_LAYOUT.itemsize,
+                                   (end - first) * INSTANCE_LAYOUT.itemsize, self.instances[first:end])
+            self.dirty = None
 
+    def draw(self, projection, view, model, primitives=GL.GL_TRIANGLES):
+        if not self.count:
+            return
+        self._upload()
+        state.use_program(self.shader.glid)
+        self.shader.set_uniforms(model=model, **material(self))
+
+        state.bind_texture(GL.GL_TEXTURE_2D, self.texture.glid)
+        state.bind_vertex_array(self.vertex_array.glid)
+        self.vertex_array.draw_instanced(primitives, self.count)
+
+    def submit(self, queue, model):
+        if self.count:
+            self._upload()
+            queue.add(self.shader, self.vertex_array, model, self.texture, instances=self.count,
+                      **material(self))
+
+    def release(self):
+        self.vertex_array.release()
+        resources.release(self.key)
@@ -3,11 +3,57 @@ from transform import identity
 
 # ------------  Node is the core drawable for hierarchical scene graphs -------
 class Node:
-    """ Scene graph transform and parameter broadcast node """
+    """ Scene graph transform and parameter broadcast node. Its world
+        transform is cached: recomputed only when its transform is assigned
+        or its parent's world transform changed, a static subtree costing
+        no matrix product per frame. Transforms are replaced, not modified
+        in place, which would not be noticed. A subtree can instead keep
+        its transforms in a TransformStore, see transformstore.py. """
+    multiplies = reused = 0  # world transforms computed and reused, see counters()
 
     def __init__(self, children=(), transform=identity()):
+        self.store = self.row = None  # TransformStore holding our transforms
         self.transform = transform
         self.children = list(iter(children))
+        self.world_transform = identity()
+        self._model = None  # parent world transform world_transform is from
+
+    @property
+    def transform(self):
+        return self._transform if self.store is None else self.store.local[self.row]
+
+    @transform.setter
+    def transform(self, transform):
+        if self.store is None:
+            self._transform = transform
+            self._model = None  # world transform out of date
+        else:
+            self.store.local[self.row] = transform
+            self.store.dirty = True
+
+    def world(self, model):
+        """ model @ transform, cached as long as neither is replaced; a new
+            array when recomputed, which invalidates the children's """
+        if self.store is not None:  # the root computes the whole store
+            if self.row == 0:
+                self.store.update(model)
+            return self.store.world[self.row]  # new view: children recompute
+        if model is not self._model:
+            self.world_transform = model @ self._transform
+            self._model = model
+            Node.multiplies += 1
+        else:
+            Node.reused += 1
+        return self.world_transform
+
+    @staticmethod
+    def counters(reset=True):
+        """ world transforms computed and reused since the last reset, e.g.
+            per frame """
+        counts = dict(multiplies=Node.multiplies, reused=Node.reused)
+        if reset:
+            Node.multiplies = Node.reused = 0
+        return counts
 
     def add(self, *drawables):
         """ Add drawables to this node, simply updating children list """
@@ -15,8 +61,20 @@ class Node:
 
     def draw(self, projection, view, model):
         """ Recursive draw, passing down updated model matrix. """
+        model = self.world(model)  # TP3: hierarchical update
+        for child in self.children:
+            child.draw(projection, view, model)
+
+    def submit(self, queue, model):
+        """ Recursive traversal queuing draw packets in a RenderQueue
+            instead of drawing; children without submit() are queued as
+            drawables """
+        model = self.world(model)
         for child in self.children:
-            child.draw(projection, view, model @ self.transform)  # TP3: hierarchical update
+            if hasattr(child, 'submit'):
+                child.submit(queue, model)
+            else:
+                queue.add_drawable(child, model)
 
     def key_handler(self, key):
         """ Dispatch keyboard events to children """
@@ -0,0 +1,67 @@
+import os
+
+from assetcache import load_scene
+from texture import textures
+from vertexarray import VertexArray, pack_vertices
+
+
+def mesh_attributes(mesh):
+    """ interleaved vertices of a MeshData, fields in shader location order """
+    return pack_vertices(mesh.vertices, mesh.uvs, mesh.normals, mesh.bone_ids, mesh.bone_weights)
+
+
+# ------------  Registry sharing imported assets between placements ---------
+class AssetRegistry:
+    """ Shares imported scenes, GPU geometry and textures: an asset placed
+        several times is imported and uploaded only once, each placement
+        only getting its own lightweight scene graph nodes. """
+
+    def __init__(self):
+        self.entries = {}
+
+    def get(self, key, factory):
+        """ shared object stored under key, built by factory() on first use """
+        if key not in self.entries:
+            self.entries[key] = factory()
+        return self.entries[key]
+
+    @staticmethod
+    def path_key(file):
+        """ same file reached through different relative paths, same key """
+        return os.path.normcase(os.path.abspath(file))
+
+    def scene(self, file, flags, path=None):
+        """ SceneData of file imported with flags, None if import failed;
+            path is its cache directory when already known """
+        return self.get(('scene', self.path_key(file), int(flags)),
+                        lambda: load_scene(file, flags, path))
+
+    def failed(self, file, flags):
+        """ record that file could not be imported with flags """
+        return self.get(('scene', self.path_key(file), int(flags)), lambda: None)
+
+    def texture(self, tex_file, levels=None):
+        """ shared GL texture of an image file, optionally already mapped.
+            The registry holds one reference on it in the texture manager """
+        return self.get(('texture', self.path_key(tex_file)),
+                        lambda: textures.acquire(tex_file, levels=levels))
+
+    def vertex_array(self, file, flags, mesh_id, mesh):
+        """ shared GPU buffers of the mesh_id-th MeshData of file, packed
+            into interleaved vertices on first use """
+        return self.get(('geometry', self.path_key(file), int(flags), mesh_id),
+                        lambda: VertexArray(attributes=mesh_attributes(mesh), index=mesh.faces))
+
+    def clear(self):
+        """ forget all shared assets, textures become evictable """
+        for key, entry in self.entries.items():
+            if key[0] == 'texture':
+                textures.release(entry)
+        self.entries = {}
+
+    def drawables(self, file, flags, material, factory):
+        """ shared list of stateless drawables for file with material params """
+        return self.get(('drawables', self.path_key(file), int(flags), material), factory)
+
+
+registry = AssetRegistry()
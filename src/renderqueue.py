@@ -0,0 +1,83 @@
+from operator import itemgetter
+
+import OpenGL.GL as GL
+
+from glstate import state
+
+OPAQUE, SKY = 0, 1  # layers, drawn in this order
+
+
+class DrawPacket:
+    """ One draw call: geometry with the program, texture and uniforms it
+        needs, drawn instances times if given, or a drawable which draws
+        itself with draw() """
+    __slots__ = ('shader', 'texture', 'vertex_array', 'primitives', 'uniforms', 'instances', 'drawable', 'model')
+
+    def __init__(self, shader=None, texture=None, vertex_array=None, primitives=GL.GL_TRIANGLES,
+                 uniforms=None, instances=None, drawable=None, model=None):
+        self.shader, self.texture, self.vertex_array = shader, texture, vertex_array
+        self.primitives, self.uniforms, self.instances = primitives, uniforms, instances
+        self.drawable, self.model = drawable, model
+
+
+# ------------  Render queue sorting draw calls by GL state -----------------
+class RenderQueue:
+    """ Collects the draw packets of a scene traversal, see Node.submit,
+        then draws them sorted by layer, program, texture and vertex array,
+        front to back among equal states, through the GL state cache which
+        skips the binds already current. self.stats counts the packets
+        and the binds of the last flush. """
+
+    def __init__(self):
+        self.packets = []  # (sort key, DrawPacket)
+        self.projection = self.view = None
+        self.stats = dict(packets=0, program_switches=0, texture_binds=0, vertex_array_binds=0, state_changes=0)
+
+    def begin(self, projection, view):
+        """ start the packets of a frame seen through view and projection """
+        self.projection, self.view = projection, view
+        self.packets = []
+
+    def _depth(self, model):
+        """ distance along the view axis of the origin of model space """
+        return -float(self.view[2] @ model[:, 3])
+
+    def add(self, shader, vertex_array, model, texture=None, primitives=GL.GL_TRIANGLES,
+            layer=OPAQUE, instances=None, **uniforms):
+        """ queue drawing vertex_array with shader and texture bound on unit
+            0, after setting the model matrix and the keyword uniforms;
+            given a number of instances, as one instanced draw call """
+        uniforms['model'] = model
+        key = (layer, shader.glid, texture.glid if texture else 0, vertex_array.glid, self._depth(model))
+        self.packets.append((key, DrawPacket(shader, texture, vertex_array, primitives, uniforms, instances)))
+
+    def add_drawable(self, drawable, model, layer=OPAQUE):
+        """ queue drawable.draw(projection, view, model), for objects which
+            set their own GL state, e.g. terrain or skybox """
+        shader = getattr(drawable, 'shader', None)
+        key = (layer, shader.glid if shader else 0, 0, 0, self._depth(model))
+        self.packets.append((key, DrawPacket(drawable=drawable, model=model)))
+
+    def flush(self):
+        """ draw the queued packets in state order and empty the queue """
+        stats = dict.fromkeys(self.stats, 0)
+        self.packets.sort(key=itemgetter(0))
+        calls = state.calls
+        for _, packet in self.packets:
+            stats['packets'] += 1
+            if packet.drawable is not None:
+                packet.drawable.draw(self.projection, self.view, packet.model)
+                continue
+            stats['program_switches'] += state.use_program(packet.shader.glid)
+            packet.shader.set_uniforms(**packet.uniforms)
+            if packet.texture is not None:
+                stats['texture_binds'] += state.bind_texture(GL.GL_TEXTURE_2D, packet.texture.glid)
+            stats['vertex_array_binds'] += state.bind_vertex_array(packet.vertex_array.glid)
+            if packet.instances is None:
+                packet.vertex_array.draw(packet.primitives)
+            else:
+                packet.vertex_array.draw_instanced(packet.primitives, packet.instances)
+        stats['state_changes'] = state.calls - calls  # drawables' included
+        self.packets = []
+        self.stats = stats
+        return stats
@@ -0,0 +1,96 @@
+import os
+import json
+import hashlib
+from bisect import bisect_left
+
+from diskcache import CACHE_DIR
+
+RESOURCES = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'resources'))
+
+
+def _inside(path, root):
+    """ True if path is root or one of its descendants """
+    path = os.path.abspath(path)
+    return path == root or path.startswith(root + os.sep)
+
+
+# ------------  File name index of a resource tree ---------------------------
+class ResourceIndex:
+    """ Index of all file names below root, built by a single walk of the
+        tree. It is persisted in the cache directory and rebuilt only when
+        the modification time of one of the indexed directories changed. """
+
+    def __init__(self, root, persist=True):
+        self.root = os.path.abspath(root)
+        self.file = None
+        if persist:
+            key = hashlib.sha1(self.root.encode()).hexdigest()
+            self.file = os.path.join(CACHE_DIR, 'index-%s.json' % key)
+        self.dirs, entries = self._read() or self._walk()
+
+        # (file name, walk order, directory) sorted by name, for prefix ranges
+        self.entries = sorted(tuple(entry) for entry in entries)
+        self.names = [entry[0] for entry in self.entries]
+        self.by_name = {}
+        for entry in self.entries:
+            self.by_name.setdefault(entry[0], []).append(entry)
+
+    def _walk(self):
+        dirs, entries = {}, []
+        for directory, _, files in os.walk(self.root, followlinks=True):
+            relative = os.path.relpath(directory, self.root)
+            dirs[relative] = os.stat(directory).st_mtime_ns
+            entries.extend((name, len(entries) + i, relative) for i, name in enumerate(files))
+        if self.file:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            with open(self.file, 'w') as stream:
+                json.dump({'root': self.root, 'dirs': dirs, 'entries': entries}, stream)
+        return dirs, entries
+
+    def _read(self):
+        """ persisted index, None if missing or out of date """
+        try:
+            with open(self.file) as stream:
+                data = json.load(stream)
+            if data['root'] == self.root and all(os.stat(os.path.join(self.root, d)).st_mtime_ns == mtime
+                                                 for d, mtime in data['dirs'].items()):
+                return data['dirs'], data['entries']
+        except (TypeError, OSError, ValueError, KeyError):
+            pass
+        return None
+
+    def find(self, name, subtree=None):
+        """ first file, in directory walk order, whose name is a prefix of
+            name or starts with name, optionally restricted to a subtree """
+        subtree = os.path.abspath(subtree or self.root)
+
+        # files starting with name: contiguous range of the sorted names
+        candidates = []
+        for index in range(bisect_left(self.names, name), len(self.names)):
+            if not self.names[index].startswith(name):
+                break
+            candidates.append(self.entries[index])
+        # files which are a prefix of name: one dict lookup per prefix
+        for length in range(1, len(name) + 1):
+            candidates.extend(self.by_name.get(name[:length], ()))
+
+        if subtree != self.root:
+            candidates = [entry for entry in candidates
+                          if _inside(os.path.join(self.root, entry[2]), subtree)]
+        if not candidates:
+            return None
+        name, _, directory = min(candidates, key=lambda entry: entry[1])
+        return os.path.normpath(os.path.join(self.root, directory, name))
+
+
+_indices = []
+
+
+def find_resource(path, name):
+    """ find file name in the subtree of path, using a shared index built once
+        for the resources tree, or once for any other tree searched in """
+    index = next((index for index in _indices if _inside(path, index.root)), None)
+    if index is None:
+        index = ResourceIndex(RESOURCES if _inside(path, RESOURCES) else path)
+        _indices.append(index)
+    return index.find(os.path.basename(name), path)
@@ -1,6 +1,47 @@
 import os
 import sys
 import OpenGL.GL as GL
+import numpy as np
+
+from glresources import resources
+
+
+def _matrix_setter(setter):
+    return lambda location, count, data: setter(location, count, True, data)
+
+
+# (setter, numpy type, components) uploading each GLSL type of uniform
+UNIFORM_TYPES = {
+    GL.GL_FLOAT: (GL.glUniform1fv, np.float32, 1),
+    GL.GL_FLOAT_VEC2: (GL.glUniform2fv, np.float32, 2),
+    GL.GL_FLOAT_VEC3: (GL.glUniform3fv, np.float32, 3),
+    GL.GL_FLOAT_VEC4: (GL.glUniform4fv, np.float32, 4),
+    GL.GL_INT: (GL.glUniform1iv, np.int32, 1),
+    GL.GL_INT_VEC2: (GL.glUniform2iv, np.int32, 2),
+    GL.GL_INT_VEC3: (GL.glUniform3iv, np.int32, 3),
+    GL.GL_INT_VEC4: (GL.glUniform4iv, np.int32, 4),
+    GL.GL_UNSIGNED_INT: (GL.glUniform1uiv, np.uint32, 1),
+    GL.GL_BOOL: (GL.glUniform1iv, np.int32, 1),
+    GL.GL_FLOAT_MAT3: (_matrix_setter(GL.glUniformMatrix3fv), np.float32, 9),
+    GL.GL_FLOAT_MAT4: (_matrix_setter(GL.glUniformMatrix4fv), np.float32, 16),
+    GL.GL_SAMPLER_2D: (GL.glUniform1iv, np.int32, 1),
+    GL.GL_SAMPLER_CUBE: (GL.glUniform1iv, np.int32, 1),
+}
+
+
+# binding point of each uniform block, see framedata.py
+BLOCK_BINDINGS = {'FrameData': 0}
+
+
+class Uniform:
+    """ active uniform of a program: location, GLSL type, array size and
+        the bytes it was last set to """
+    __slots__ = ('location', 'type', 'size', 'setter', 'dtype', 'components', 'value')
+
+    def __init__(self, location, gl_type, size):
+        self.location, self.type, self.size = location, gl_type, size
+        self.setter, self.dtype, self.components = UNIFORM_TYPES[gl_type]
+        self.value = None
 
 
 # ------------ low level OpenGL object wrappers ----------------------------
@@ -31,6 +72,7 @@ class Shader:
         frag = self._compile_shader(fragment_source, GL.GL_FRAGMENT_SHADER)
         if vert and frag:
             self.glid = GL.glCreateProgram()  # pylint: disable=E1111
+            self.key = resources.track('program', self.glid, self, category='shader')
             GL.glAttachShader(self.glid, vert)
             GL.glAttachShader(self.glid, frag)
             GL.glLinkProgram(self.glid)
@@ -40,8 +82,43 @@ class Shader:
             if not status:
                 print(GL.glGetProgramInfoLog(self.glid).decode('ascii'))
                 sys.exit(1)
+        self.uniforms = self._reflect() if self.glid else {}
+        for name, binding in BLOCK_BINDINGS.items() if self.glid else ():
+            index = GL.glGetUniformBlockIndex(self.glid, name)
+            if index != GL.GL_INVALID_INDEX:
+                GL.glUniformBlockBinding(self.glid, index, binding)
+
+    def _reflect(self):
+        """ Uniform of each active uniform name, arrays by their bare name;
+            uniforms of blocks have no location and are left out """
+        uniforms = {}
+        for index in range(GL.glGetProgramiv(self.glid, GL.GL_ACTIVE_UNIFORMS)):
+            name, size, gl_type = GL.glGetActiveUniform(self.glid, index)
+            name = name.decode('ascii') if isinstance(name, bytes) else name
+            location = GL.glGetUniformLocation(self.glid, name)
+            if location >= 0 and gl_type in UNIFORM_TYPES:
+                uniforms[name.split('[')[0]] = Uniform(location, int(gl_type), int(size))
+        return uniforms
+
+    def set(self, name, value):
+        """ upload value to uniform name of this program, which must be in
+            use, unless the uniform already holds it. Arrays are set whole
+            or from their start, matrices are given row major. Names
+            the linker optimized away are ignored, as GL does """
+        uniform = self.uniforms.get(name)
+        if uniform is None:
+            return
+        data = np.ascontiguousarray(value, uniform.dtype)
+        raw = data.tobytes()
+        if raw != uniform.value:
+            uniform.value = raw
+            uniform.setter(uniform.location, min(data.size // uniform.components, uniform.size), data)
+
+    def set_uniforms(self, **values):
+        """ set() each keyword uniform """
+        for name, value in values.items():
+            self.set(name, value)
 
-    def __del__(self):
-        GL.glUseProgram(0)
+    def release(self):  # delete GL program at the end of the frame
         if self.glid:  # if this is a valid shader object
-            GL.glDeleteProgram(self.glid)  # object dies => destroy GL object
+            resources.release(self.key)
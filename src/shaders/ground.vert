@@ -2,9 +2,18 @@
 layout(location = 0) in vec3 position;
 layout(location = 1) in vec3 normal;
 
+const int NUM_LIGHT_SRC = 4;
+
 uniform mat4 model;
-uniform mat4 view;
-uniform mat4 projection;
+
+// frame constants shared by all shaders, filled once per frame, see framedata.py
+layout(std140) uniform FrameData {
+    mat4 view, projection;
+    vec3 w_camera_position;
+    vec3 color;
+    vec3 light_position[NUM_LIGHT_SRC];
+    vec3 atten_factor[NUM_LIGHT_SRC];
+};
 out vec3 fragNormal;
 out vec3 fragView;
 
@@ -10,8 +10,16 @@ layout(location = 0) in vec3 position;
 layout(location = 1) in vec2 uvs;
 layout(location = 2) in vec3 normal;
 
-uniform mat4 model, view, projection;
-uniform vec3 light_position[NUM_LIGHT_SRC];
+uniform mat4 model;
+
+// frame constants shared by all shaders, filled once per frame, see framedata.py
+layout(std140) uniform FrameData {
+    mat4 view, projection;
+    vec3 w_camera_position;
+    vec3 color;
+    vec3 light_position[NUM_LIGHT_SRC];
+    vec3 atten_factor[NUM_LIGHT_SRC];
+};
 
 // position and normal for the fragment shader, in WORLD coordinates
 out vec3 w_position, w_normal;
@@ -19,6 +27,7 @@ out vec2 frag_uv;
 out float visibility;
 out vec3 to_light_vector[NUM_LIGHT_SRC];
 out vec3 surface_normal;
+out vec4 frag_tint;
 
 
 void main() {
@@ -28,6 +37,7 @@ void main() {
 
     gl_Position = projection * positionRelativeToCam;
     frag_uv = vec2(uvs.x, uvs.y);
+    frag_tint = vec4(1);
 
     // shadow calculation
     w_position =  worldPosition.xyz / worldPosition.w;
@@ -10,8 +10,6 @@ in vec3 w_position, w_normal;
 in vec3 to_light_vector[NUM_LIGHT_SRC];
 in float visibility;
 
-uniform vec3 w_camera_position;
-
 uniform vec3 k_d, k_a, k_s;
 uniform float s;
 
@@ -19,8 +17,14 @@ uniform sampler2D diffuse_map;
 
 out vec4 out_color;
 
-uniform vec3 color;
-uniform vec3 atten_factor[NUM_LIGHT_SRC];
+// frame constants shared by all shaders, filled once per frame, see framedata.py
+layout(std140) uniform FrameData {
+    mat4 view, projection;
+    vec3 w_camera_position;
+    vec3 color;
+    vec3 light_position[NUM_LIGHT_SRC];
+    vec3 atten_factor[NUM_LIGHT_SRC];
+};
 
 
 void main() {
@@ -5,8 +5,16 @@ const int NUM_LIGHT_SRC = 4;
 const float density = 0.007;
 const float gradient = 1.5;
 
-uniform mat4 projection, view, model;
-uniform vec3 light_position[NUM_LIGHT_SRC];
+uniform mat4 model;
+
+// frame constants shared by all shaders, filled once per frame, see framedata.py
+layout(std140) uniform FrameData {
+    mat4 view, projection;
+    vec3 w_camera_position;
+    vec3 color;
+    vec3 light_position[NUM_LIGHT_SRC];
+    vec3 atten_factor[NUM_LIGHT_SRC];
+};
 
 const int MAX_VERTEX_BONES=4, MAX_BONES=128;
 uniform mat4 bone_matrix[MAX_BONES];
@@ -14,7 +22,7 @@ uniform mat4 bone_matrix[MAX_BONES];
 layout(location = 0) in vec3 position;
 layout(location = 1) in vec3 uvs;
 layout(location = 2) in vec3 normal;
-layout(location = 3) in vec4 bone_ids;
+layout(location = 3) in uvec4 bone_ids;
 layout(location = 4) in vec4 bone_weights;
 
 out vec3 fragment_color;
@@ -31,7 +39,7 @@ void main() {
 
     mat4 skin_matrix = mat4(0);
     for (int b=0;b< MAX_VERTEX_BONES;b++)
-        skin_matrix += bone_weights[b] * bone_matrix[int(bone_ids[b])];
+        skin_matrix += bone_weights[b] * bone_matrix[bone_ids[b]];
 
     vec4 w_position4 = skin_matrix * vec4(position, 1.0);
     
@@ -2,9 +2,21 @@
 
 layout (location = 0) in vec3 position;
 out vec3 fragTexCoord;
-uniform mat4 modelviewprojection;
+
+const int NUM_LIGHT_SRC = 4;
+
+uniform mat4 model;
+
+// frame constants shared by all shaders, filled once per frame, see framedata.py
+layout(std140) uniform FrameData {
+    mat4 view, projection;
+    vec3 w_camera_position;
+    vec3 color;
+    vec3 light_position[NUM_LIGHT_SRC];
+    vec3 atten_factor[NUM_LIGHT_SRC];
+};
 
 void main() {
     fragTexCoord = position;
-    gl_Position = modelviewprojection * vec4(position, 1.0);
+    gl_Position = projection * view * model * vec4(position, 1.0);
 }
\ No newline at end of file
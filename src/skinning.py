@@ -1,9 +1,10 @@
 import numpy as np
 import glfw
 import OpenGL.GL as GL
+from glstate import state
 from mesh import Mesh
 from node import Node
-from keyframe import TransformKeyFrames
+from keyframe import TransformKeyFrames, TransformKeyFramesBatch
 from transform import identity
 
 # -------------- Linear Blend Skinning : TP7 ---------------------------------
@@ -11,6 +12,44 @@ MAX_VERTEX_BONES = 4
 MAX_BONES = 128
 
 
+def pack_bone_weights(vertex_ids, bone_ids, weights, num_vertices):
+	""" per vertex MAX_VERTEX_BONES strongest (id, weight) pairs, from flat
+		(vertex, bone, weight) triples. Pairs are in increasing weight order,
+		unused slots are (0, 0) and weights are renormalized to sum to 1. """
+	vertex_ids, bone_ids = np.asarray(vertex_ids, np.int64), np.asarray(bone_ids, np.int64)
+	weights = np.asarray(weights, np.float32)
+	keep = bone_ids < MAX_BONES
+	vertex_ids, bone_ids, weights = vertex_ids[keep], bone_ids[keep], weights[keep]
+
+	# a (vertex, bone) pair given twice keeps its last weight
+	_, last = np.unique((vertex_ids * MAX_BONES + bone_ids)[::-1], return_index=True)
+	last = len(vertex_ids) - 1 - last
+	vertex_ids, bone_ids, weights = vertex_ids[last], bone_ids[last], weights[last]
+
+	# scatter influences in a (num_vertices, max influences) table
+	counts = np.bincount(vertex_ids, minlength=num_vertices)
+	width = max(MAX_VERTEX_BONES, counts.max(initial=0))
+	order = np.argsort(vertex_ids, kind='stable')
+	rank = np.arange(len(order)) - (np.cumsum(counts) - counts)[vertex_ids[order]]
+	table_weights = np.zeros((num_vertices, width), np.float32)
+	table_ids = np.zeros((num_vertices, width), np.uint32)
+	table_weights[vertex_ids[order], rank] = weights[order]
+	table_ids[vertex_ids[order], rank] = bone_ids[order]
+
+	# partial selection of the strongest influences, then order the few kept
+	if width > MAX_VERTEX_BONES:
+		strongest = np.argpartition(table_weights, width - MAX_VERTEX_BONES, axis=1)[:, -MAX_VERTEX_BONES:]
+		table_weights = np.take_along_axis(table_weights, strongest, axis=1)
+		table_ids = np.take_along_axis(table_ids, strongest, axis=1)
+	order = np.lexsort((table_ids, table_weights), axis=1)
+	table_weights = np.take_along_axis(table_weights, order, axis=1)
+	table_ids = np.take_along_axis(table_ids, order, axis=1)
+
+	total = table_weights.sum(axis=1, keepdims=True)
+	np.divide(table_weights, total, out=table_weights, where=total > 0)
+	return table_ids, table_weights
+
+
 class SkinnedMesh(Mesh):
 	"""class of skinned mesh nodes in scene graph """
 
@@ -22,12 +61,11 @@ class SkinnedMesh(Mesh):
 
 	def draw(self, projection, view, model, primitives=GL.GL_TRIANGLES):
 		""" skinning object draw method """
-		GL.glUseProgram(self.shader.glid)
+		state.use_program(self.shader.glid)
 
 		world_transforms = [node.world_transform for node in self.bone_nodes]
 		bone_matrix = world_transforms @ self.bone_offsets
-		loc = GL.glGetUniformLocation(self.shader.glid, 'bone_matrix')
-		GL.glUniformMatrix4fv(loc, len(self.bone_nodes), True, bone_matrix)
+		self.shader.set('bone_matrix', bone_matrix)
 
 		super().draw(projection, view, model)
 
@@ -39,19 +77,47 @@ class SkinningControlNode(Node):
 	def __init__(self, *keys, transform=identity(), delay=None):
 		super().__init__(transform=transform)
 		self.keyframes = TransformKeyFrames(*keys) if keys[0] else None
-		self.world_transform = identity()
 		self.time = glfw.get_time()
 
 		self.delay = delay
 
-	def draw(self, projection, view, model):
-		""" When redraw requested, interpolate our node transform from keys """
+	def interpolate(self):
+		""" interpolate our node transform from keys """
 		self.time = glfw.get_time()
 		if self.keyframes:
 			if self.delay is not None:
 				self.time = glfw.get_time() % self.delay
 			self.transform = self.keyframes.value(self.time)
 
-		self.world_transform = model @ self.transform
+	@classmethod
+	def interpolator(cls, store, nodes):
+		""" function interpolating the transforms of nodes, rows of a
+			TransformStore, all at once with TransformKeyFramesBatch """
+		nodes = [node for node in nodes if node.keyframes]
+		if not nodes:
+			return lambda: None
+		keyframes = TransformKeyFramesBatch([node.keyframes for node in nodes])
+		rows = np.array([node.row for node in nodes])
+		delays = np.array([np.inf if node.delay is None else node.delay for node in nodes])
+
+		def interpolate():
+			store.local[rows] = keyframes.value(np.mod(glfw.get_time(), delays))
+			store.dirty = True
+		return interpolate
+
+	def animate(self, model):
+		""" interpolate then update world transform; in a TransformStore
+			the root's Node.world does both for the whole skeleton, once """
+		if self.store is None:
+			self.interpolate()
+			self.world(model)
 
+	def draw(self, projection, view, model):
+		""" When redraw requested, animate then draw the subtree """
+		self.animate(model)
 		super().draw(projection, view, model)
+
+	def submit(self, queue, model):
+		""" animate then queue the subtree """
+		self.animate(model)
+		super().submit(queue, model)
@@ -2,8 +2,10 @@ import OpenGL.GL as GL
 import numpy as np
 
 from cubemap import Cubemap
+from glstate import state
 from shader import Shader
 from vertexarray import VertexArray
+from renderqueue import SKY
 from transform import rotate, scale
 
 # Drawing the cube faces, each face takes up 2 triangles
@@ -52,29 +54,27 @@ CUBE_VERTS = [np.array((
 
 
 class Skybox:
-	def __init__(self, files):
+	def __init__(self, files, compression=None):
 		self.shader = Shader('shaders/skybox.vert', 'shaders/skybox.frag')
 		self.vertex_array = VertexArray(CUBE_VERTS)
-		self.cubemap = Cubemap(files)
+		self.cubemap = Cubemap(files, compression)
 
 	def draw(self, projection, view, model, color_shader=None, win=None, **param):
 		""" Draw object """
-		GL.glDepthFunc(GL.GL_LEQUAL)
-		GL.glUseProgram(self.shader.glid)
+		state.depth_func(GL.GL_LEQUAL)
+		state.use_program(self.shader.glid)
 
 		# projection geometry
-		loc = GL.glGetUniformLocation(self.shader.glid, 'modelviewprojection')
-		GL.glUniformMatrix4fv(loc, 1, True, projection @ view @ scale(200, 200, 200) @ np.identity(4, 'f'))
+		self.shader.set('model', scale(200, 200, 200))
 
 		# texture access setups
-		loc = GL.glGetUniformLocation(self.shader.glid, 'skybox')
-		GL.glActiveTexture(GL.GL_TEXTURE0)
-		GL.glBindTexture(GL.GL_TEXTURE_CUBE_MAP, self.cubemap.glid)
+		state.bind_texture(GL.GL_TEXTURE_CUBE_MAP, self.cubemap.glid)
 
-		GL.glUniform1i(loc, 0)
+		self.shader.set('skybox', 0)
 		self.vertex_array.execute(GL.GL_TRIANGLES)
 
-		GL.glDepthFunc(GL.GL_LESS)
+		state.depth_func(GL.GL_LESS)
 
-		GL.glBindTexture(GL.GL_TEXTURE_CUBE_MAP, 0)
-		GL.glUseProgram(0)
+	def submit(self, queue, model):
+		""" queued last, the sky only shades the pixels the scene left empty """
+		queue.add_drawable(self, model, layer=SKY)
@@ -0,0 +1,112 @@
+import ctypes
+
+import OpenGL.GL as GL
+import numpy as np
+
+from glstate import state
+from mesh import material
+from node import Node
+from transform import boxes_in_frustum, frustum_planes
+from vertexarray import PHONG_VERTEX, VertexArray, snorm16
+
+
+def transform_vertices(vertices, transform):
+    """ copy of PHONG_VERTEX vertices with positions and normals mapped by
+        transform, normals by its inverse transpose, renormalized """
+    transform = np.asarray(transform, np.float64)
+    moved = vertices.copy()
+    moved['position'] = vertices['position'] @ transform[:3, :3].T + transform[:3, 3]
+    normals = (vertices['normal'][:, :3] / 32767.) @ np.linalg.inv(transform[:3, :3])
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    moved['normal'][:, :3] = snorm16(normals / np.where(lengths > 0, lengths, 1))
+    return moved
+
+
+# ------------  Static meshes merged into one buffer, drawn culled -----------
+class StaticBatch:
+    """ Static meshes sharing a shader, texture and material, merged into
+        one vertex and index buffer with their vertices pre-transformed.
+        Each object keeps its range of indices and its bounding box: draw()
+        culls the objects against the view frustum and draws the others
+        with a single glMultiDrawElements. add() uploads only the new
+        object, unless the buffers must grow, doubling their capacity. """
+
+    def __init__(self, shader, texture, k_a=(1, 1, 1), k_d=(1, 1, 0), k_s=(1, 1, 0), s=64., capacity=1 << 12):
+        self.shader, self.texture = shader, texture
+        self.k_a, self.k_d, self.k_s, self.s = k_a, k_d, k_s, s
+        self.vertices = np.zeros(capacity, PHONG_VERTEX)
+        self.indices = np.zeros(3 * capacity, np.uint32)
+        self.nb_vertices = self.nb_indices = 0
+        self.firsts, self.counts = [], []  # index range per object
+        self.lows, self.highs = np.zeros((0, 3)), np.zeros((0, 3))  # bounding box per object
+        self.vertex_array = None
+        self.drawn = 0  # objects drawn by the last draw()
+        self._allocate()
+
+    def _allocate(self):
+        """ new buffers of the current capacity, holding all objects """
+        if self.vertex_array is not None:
+            self.vertex_array.release()
+        self.vertex_array = VertexArray(self.vertices, self.indices, usage=GL.GL_DYNAMIC_DRAW)
+        self.index_type = GL.GL_UNSIGNED_SHORT if self.vertex_array.index_dtype == np.uint16 else GL.GL_UNSIGNED_INT
+
+    def add(self, vertices, faces, transform):
+        """ append the PHONG_VERTEX vertices and triangles of a mesh placed
+            by transform, return the object index """
+        vertices = transform_vertices(vertices, transform)
+        faces = np.asarray(faces, np.uint32).ravel() + self.nb_vertices
+        first_vertex, first = self.nb_vertices, self.nb_indices
+        end_vertex, end = first_vertex + len(vertices), first + len(faces)
+
+        grow = end_vertex > len(self.vertices) or end > len(self.indices)
+        while end_vertex > len(self.vertices):
+            self.vertices = np.resize(self.vertices, 2 * len(self.vertices))
+        while end > len(self.indices):
+            self.indices = np.resize(self.indices, 2 * len(self.indices))
+        self.vertices[first_vertex:end_vertex] = vertices
+        self.indices[first:end] = faces
+        self.nb_vertices, self.nb_indices = end_vertex, end
+        if grow:
+            self._allocate()
+        else:
+            self.vertex_array.update(vertices, first_vertex)
+            self.vertex_array.update_index(faces, first)
+
+        self.firsts.append(first)
+        self.counts.append(len(faces))
+        self.lows = np.vstack([self.lows, vertices['position'].min(axis=0)])
+        self.highs = np.vstack([self.highs, vertices['position'].max(axis=0)])
+        return len(self.counts) - 1
+
+    def draw(self, projection, view, model, primitives=GL.GL_TRIANGLES):
+        visible = np.flatnonzero(boxes_in_frustum(frustum_planes(projection @ view @ model), self.lows, self.highs))
+        self.drawn = len(visible)
+        if not self.drawn:
+            return
+        counts = np.asarray(self.counts, np.int32)[visible]
+        offsets = np.asarray(self.firsts, np.uintp)[visible] * self.vertex_array.index_dtype.itemsize
+
+        state.use_program(self.shader.glid)
+        self.shader.set_uniforms(model=model, **material(self))
+        state.bind_texture(GL.GL_TEXTURE_2D, self.texture.glid)
+        state.bind_vertex_array(self.vertex_array.glid)
+        GL.glMultiDrawElements(primitives, counts, self.index_type,
+                               (ctypes.c_void_p * self.drawn)(*offsets.tolist()), self.drawn)
+
+
+class StaticBatches(Node):
+    """ Node merging the static meshes added to it into one StaticBatch per
+        shader, texture and material, drawn in its model space """
+
+    def __init__(self):
+        super().__init__()
+        self.batches = {}
+
+    def add_mesh(self, shader, texture, vertices, faces, transform, k_a=(1, 1, 1), k_d=(1, 1, 0),
+                 k_s=(1, 1, 0), s=64.):
+        """ add a mesh to the batch of its shader, texture and material """
+        key = (shader.glid, texture.glid, tuple(k_a), tuple(k_d), tuple(k_s), s)
+        if key not in self.batches:
+            self.batches[key] = StaticBatch(shader, texture, k_a, k_d, k_s, s)
+            self.add(self.batches[key])
+        return self.batches[key].add(vertices, faces, transform)
@@ -0,0 +1,393 @@
+import ctypes
+import queue
+import threading
+from collections import OrderedDict
+
+import OpenGL.GL as GL
+import numpy as np
+
+from glresources import resources
+from glstate import state
+from heightfield import HEIGHTMAP, ORIGIN, load_heightfield
+from node import Node
+from textureground import TextureGround
+from transform import boxes_in_frustum, frustum_planes, rotate, translate
+from vertexarray import VertexArray
+
+# tile sides, as bits of a stitch mask: set when the neighbour is coarser
+NORTH, SOUTH, WEST, EAST = 1, 2, 4, 8
+MASKS = 16
+
+FAR = 1e30  # bounds of the empty boxes padding the quadtree
+
+
+def tile_cells(cells, max_tiles=32):
+    """ power of two cells per tile side, 32 to 128, for at most max_tiles
+        tiles per side; 129x129 tile vertices still fit 16 bit indices """
+    tile = 32
+    while tile < 128 and tile * max_tiles < cells:
+        tile *= 2
+    return tile
+
+
+def tile_indices(cells, lod, mask):
+    """ (N, 3) triangles of a tile of cells x cells quads at level of
+        detail lod, vertices on the sides of mask snapped onto the grid of
+        the next coarser level so that they match a coarser neighbour """
+    step, side = 1 << lod, cells + 1
+    corners = np.arange(0, cells, step)
+    top_left = (corners[:, None] * side + corners).reshape(-1, 1)
+    quads = top_left + np.array([0, step * side, step, step, step * side, step * side + step])
+
+    # odd vertices of the stitched sides collapse onto their previous one
+    rows, cols = np.divmod(np.arange(side * side), side)
+    snap = np.arange(side * side)
+    odd_cols, odd_rows = cols % (2 * step) == step, rows % (2 * step) == step
+    for bit, on_side, odd, shift in ((NORTH, rows == 0, odd_cols, step), (SOUTH, rows == cells, odd_cols, step),
+                                     (WEST, cols == 0, odd_rows, step * side),
+                                     (EAST, cols == cells, odd_rows, step * side)):
+        if mask & bit:
+            snap[on_side & odd] -= shift
+    triangles = snap[quads].reshape(-1, 3)
+
+    degenerate = (triangles[:, 0] == triangles[:, 1]) | (triangles[:, 1] == triangles[:, 2]) \
+        | (triangles[:, 0] == triangles[:, 2])
+    return triangles[~degenerate]
+
+
+def _upsample(heights, step):
+    """ heights linearly interpolated from their samples every step texels,
+        along the last two axes """
+    size = heights.shape[-1]
+    index = np.arange(size)
+    low = np.minimum(index // step, (size - 1) // step - 1)
+    fraction = (index - low * step) / step
+    coarse = heights[..., ::step, ::step]
+    rows = coarse[..., low, :] * (1 - fraction)[:, None] + coarse[..., low + 1, :] * fraction[:, None]
+    return rows[..., low] * (1 - fraction) + rows[..., low + 1] * fraction
+
+
+def tile_errors(heights, lods):
+    """ (..., lods) largest height error of each level of detail of tiles
+        of (..., cells + 1, cells + 1) heights, never decreasing with level """
+    errors = [np.zeros(heights.shape[:-2])]
+    for lod in range(1, lods):
+        error = np.abs(_upsample(heights, 1 << lod) - heights).max(axis=(-2, -1))
+        errors.append(np.maximum(error, errors[-1]))
+    return np.stack(errors, axis=-1)
+
+
+def screen_lods(errors, lows, highs, eye, scale, tolerance):
+    """ coarsest level of detail of each tile whose error projects to at
+        most tolerance pixels, seen from eye; scale is the size in pixels of
+        one unit seen at a distance of one unit """
+    nearest = np.clip(eye, lows, highs)
+    distance = np.maximum(np.linalg.norm(nearest - eye, axis=1), 1e-3)
+    return (errors * scale <= tolerance * distance[:, None]).sum(axis=1) - 1
+
+
+def balance_lods(lods, coarsest):
+    """ lower the levels of a grid of tiles until neighbours differ by at
+        most one level """
+    while True:
+        padded = np.pad(lods, 1, constant_values=coarsest)
+        limit = np.minimum.reduce([padded[:-2, 1:-1], padded[2:, 1:-1],
+                                   padded[1:-1, :-2], padded[1:-1, 2:]]) + 1
+        if (lods <= limit).all():
+            return lods
+        lods = np.minimum(lods, limit)
+
+
+def stitch_masks(lods):
+    """ sides of each tile of a grid whose neighbour is one level coarser """
+    padded = np.pad(lods, 1, constant_values=-1)
+    masks = np.zeros(lods.shape, np.int64)
+    for bit, neighbour in ((NORTH, padded[:-2, 1:-1]), (SOUTH, padded[2:, 1:-1]),
+                           (WEST, padded[1:-1, :-2]), (EAST, padded[1:-1, 2:])):
+        masks |= np.where(neighbour > lods, bit, 0)
+    return masks
+
+
+# ------------  Index buffer shared by all tiles of a terrain ----------------
+class TileIndices:
+    """ Triangles of every level of detail of a tile, in the 16 stitching
+        variants of each, uploaded in one 16 bit index buffer which every
+        tile vertex array binds """
+
+    def __init__(self, tile):
+        self.lods = tile.bit_length() - 1  # coarsest level keeps 2x2 quads
+        chunks, self.ranges, offset = [], np.zeros((self.lods, MASKS, 2), np.int64), 0
+        for lod in range(self.lods):
+            for mask in range(MASKS):
+                # the coarsest level has no coarser neighbour to stitch to
+                triangles = tile_indices(tile, lod, mask if lod < self.lods - 1 else 0)
+                chunks.append(triangles.astype(np.uint16).reshape(-1))
+                self.ranges[lod, mask] = offset, chunks[-1].size
+                offset += chunks[-1].nbytes
+        self.glid = GL.glGenBuffers(1)
+        state.bind_vertex_array(0)
+        GL.glBindBuffer(GL.GL_ELEMENT_ARRAY_BUFFER, self.glid)
+        GL.glBufferData(GL.GL_ELEMENT_ARRAY_BUFFER, np.concatenate(chunks), GL.GL_STATIC_DRAW)
+        self.key = resources.track('buffer', self.glid, self, offset, 'index buffer', 'terrain')
+
+    def attach(self, vertex_array):
+        """ make the index buffer part of the state of vertex_array """
+        state.bind_vertex_array(vertex_array.glid)
+        GL.glBindBuffer(GL.GL_ELEMENT_ARRAY_BUFFER, self.glid)
+
+    def draw(self, vertex_array, lod, mask, primitives=GL.GL_TRIANGLES):
+        """ draw a tile at lod stitched on mask sides, returns its triangles """
+        offset, count = self.ranges[lod, mask]
+        state.bind_vertex_array(vertex_array.glid)
+        GL.glDrawElements(primitives, int(count), GL.GL_UNSIGNED_SHORT, ctypes.c_void_p(int(offset)))
+        return int(count) // 3
+
+    def release(self):
+        resources.release(self.key)
+
+
+# ------------  Terrain tiles in a quadtree, culled and geomipmapped ---------
+class Terrain(Node):
+    """ Heightmap terrain split in square tiles, each with its own vertex
+        buffer. All tiles share one index buffer holding every level of
+        detail, in 16 variants stitching the sides facing a coarser tile.
+        Each frame, tiles are culled against the view frustum through a
+        quadtree of their bounding boxes, and their level of detail is the
+        coarsest one whose geometric error projects to at most tolerance
+        pixels, neighbour levels differing by at most one. """
+
+    def __init__(self, shader, heightmapFile, tile=None, tolerance=4.0):
+        super().__init__()
+        self.shader = shader
+        self.tolerance = tolerance
+
+        image = load_heightfield(heightmapFile).image
+        size = image.shape[0]
+        vertices, uvs, normals, _ = TextureGround.create_attributes(size, image)
+        self.tile = tile = tile or tile_cells(size - 1)
+        self.count = -(-(size - 1) // tile)  # tiles per side
+        self.indices = TileIndices(tile)
+        self.lods = self.indices.lods
+
+        # global vertex indices of each tile, clamped into the map: quads
+        # past its border collapse to degenerate triangles
+        starts = np.arange(self.count) * tile
+        lines = np.minimum(starts[:, None] + np.arange(tile + 1), size - 1)
+        grid = lines[:, None, :, None] * size + lines[None, :, None, :]  # (row, col, r, c)
+
+        self.vertex_arrays = np.empty((self.count, self.count), object)
+        for row, col in np.ndindex(self.count, self.count):
+            ids = grid[row, col].reshape(-1)
+            self.vertex_arrays[row, col] = VertexArray([vertices[ids], uvs[ids], normals[ids]])
+            self.indices.attach(self.vertex_arrays[row, col])
+
+        # bounding boxes and geometric error of every tile level, in the
+        # model space of the terrain
+        heights = vertices[:, 1][grid]
+        lows = np.stack(np.broadcast_arrays(vertices[grid[:, :, 0, 0], 0], heights.min(axis=(2, 3)),
+                                            vertices[grid[:, :, 0, 0], 2]), axis=-1)
+        highs = np.stack(np.broadcast_arrays(vertices[grid[:, :, -1, -1], 0], heights.max(axis=(2, 3)),
+                                             vertices[grid[:, :, -1, -1], 2]), axis=-1)
+        self.lows, self.highs = lows.reshape(-1, 3), highs.reshape(-1, 3)
+        self.errors = tile_errors(heights, self.lods).reshape(-1, self.lods)
+        self._quadtree(lows, highs)
+        self.triangles = 0  # drawn during the last frame
+
+    def _quadtree(self, lows, highs):
+        """ bounding boxes of the quadtree nodes, one array per depth, from
+            the root down to the tiles padded to a power of two per side """
+        side = 1 << (self.count - 1).bit_length()
+        level_lows, level_highs = np.full((side, side, 3), FAR), np.full((side, side, 3), -FAR)
+        level_lows[:self.count, :self.count], level_highs[:self.count, :self.count] = lows, highs
+        self.levels = [(level_lows, level_highs)]
+        while side > 1:
+            side //= 2
+            level_lows = level_lows.reshape(side, 2, side, 2, 3).min(axis=(1, 3))
+            level_highs = level_highs.reshape(side, 2, side, 2, 3).max(axis=(1, 3))
+            self.levels.insert(0, (level_lows, level_highs))
+
+    def visible(self, planes):
+        """ (row, col) of the tiles in the frustum, descending the quadtree
+            only below the nodes that are in the frustum """
+        nodes = np.zeros((1, 2), np.int64)
+        for depth, (lows, highs) in enumerate(self.levels):
+            if depth:
+                nodes = (nodes[:, None, :] * 2 + [(0, 0), (0, 1), (1, 0), (1, 1)]).reshape(-1, 2)
+            inside = boxes_in_frustum(planes, lows[nodes[:, 0], nodes[:, 1]], highs[nodes[:, 0], nodes[:, 1]])
+            nodes = nodes[inside]
+        return nodes
+
+    def select_lods(self, eye, scale):
+        """ level of detail of every tile for a camera at eye, scale being
+            the size in pixels of one unit seen at a distance of one unit """
+        lods = screen_lods(self.errors, self.lows, self.highs, eye, scale, self.tolerance)
+        return balance_lods(lods.reshape(self.count, self.count), self.lods)
+
+    def draw(self, projection, view, model, primitives=GL.GL_TRIANGLES):
+        eye = np.linalg.inv(view @ model)[:3, 3]
+        viewport_height = state.get_viewport()[3]  # cached, see Viewer.on_resize
+        lods = self.select_lods(eye, projection[1, 1] * viewport_height / 2)
+        masks = stitch_masks(lods)
+
+        state.use_program(self.shader.glid)
+        self.shader.set('model', model)
+
+        self.triangles = 0
+        for row, col in self.visible(frustum_planes(projection @ view @ model)):
+            self.triangles += self.indices.draw(self.vertex_arrays[row, col], lods[row, col],
+                                                masks[row, col], primitives)
+
+    def submit(self, queue, model):
+        queue.add_drawable(self, model)
+
+    def key_handler(self, key):
+        return
+
+
+# ------------  Streaming terrain paged from a memory mapped heightmap ------
+def build_tile(field, tile, row, col):
+    """ CPU side payload of tile (row, col) of a HeightField: vertex
+        attributes in the model space of the terrain, bounding box and
+        level errors. Reads only the samples of the tile and its border,
+        no GL call so that it can run in any thread. """
+    size, spacing = field.size, field.spacing
+    rows = np.clip(row * tile + np.arange(-1, tile + 2), 0, size - 1)
+    cols = np.clip(col * tile + np.arange(-1, tile + 2), 0, size - 1)
+    heights = np.asarray(field.samples[np.ix_(rows, cols)], np.float32) * np.float32(field.scale)
+    inner = heights[1:-1, 1:-1]
+
+    # central differences, one sided on the map border
+    dx = (heights[1:-1, 2:] - heights[1:-1, :-2]) / (spacing * (cols[2:] - cols[:-2]).clip(1))
+    dz = (heights[2:, 1:-1] - heights[:-2, 1:-1]) / (spacing * (rows[2:] - rows[:-2]).clip(1))[:, None]
+    normals = np.stack((-dx, np.ones_like(dx), -dz), axis=-1)
+    normals /= np.linalg.norm(normals, axis=-1, keepdims=True)
+
+    z, x = np.meshgrid(rows[1:-1], cols[1:-1], indexing='ij')
+    vertices = np.stack((x * spacing, inner, z * spacing), axis=-1).astype(np.float32)
+    uvs = np.stack((x, z), axis=-1).astype(np.float32) / (size - 1)
+    low = (cols[1] * spacing, inner.min(), rows[1] * spacing)
+    high = (cols[-2] * spacing, inner.max(), rows[-2] * spacing)
+    attributes = [vertices.reshape(-1, 3), uvs.reshape(-1, 2), normals.reshape(-1, 3).astype(np.float32)]
+    return attributes, low, high, tile_errors(inner, tile.bit_length() - 1)
+
+
+class StreamingTerrain(Node):
+    """ Terrain of a HeightField too large to be held in memory, e.g. a
+        memory mapped raw heightmap. Tiles within radius tiles of the camera
+        are built by a background thread, reading only their samples, and
+        at most uploads of them are turned into vertex arrays per frame, so
+        that the render loop never waits. Resident tiles are kept in a least
+        recently used cache of capacity tiles, drawn culled and with levels
+        of detail like Terrain tiles. """
+
+    def __init__(self, shader, field, tile=64, radius=8, capacity=None, uploads=4, tolerance=4.0):
+        super().__init__()
+        self.shader = shader
+        self.field = field
+        self.tile, self.radius, self.uploads, self.tolerance = tile, radius, uploads, tolerance
+        self.capacity = capacity or 2 * (2 * radius + 1) ** 2
+        self.count = -(-(field.size - 1) // tile)  # tiles per side
+        self.indices = TileIndices(tile)
+
+        self.resident = OrderedDict()  # (row, col) -> (vertex array, low, high, errors), LRU first
+        self.pending = set()  # requested, not uploaded yet
+        self.wanted = frozenset()  # tiles around the camera, read by the worker
+        self.requests, self.results = queue.PriorityQueue(), queue.Queue()
+        self.worker = threading.Thread(target=self._work, daemon=True)
+        self.worker.start()
+        resources.at_shutdown(self.close)
+        self.triangles = 0  # drawn during the last frame
+
+    def _work(self):
+        """ background thread: build requested tiles still wanted """
+        while True:
+            _, key = self.requests.get()
+            if key is None:
+                return
+            payload = build_tile(self.field, self.tile, *key) if key in self.wanted else None
+            self.results.put((key, payload))
+
+    def update(self, eye):
+        """ request the tiles around eye, in model space, nearest first,
+            upload a few built ones and evict the least recently used;
+            returns the first and last + 1 (row, col) of the wanted tiles """
+        center = np.array((eye[2], eye[0])) / (self.tile * self.field.spacing)
+        first = np.clip(np.floor(center).astype(int) - self.radius, 0, self.count)
+        last = np.clip(np.floor(center).astype(int) + self.radius + 1, 0, self.count)
+        keys = [(row, col) for row in range(first[0], last[0]) for col in range(first[1], last[1])]
+        distances = {key: float(np.hypot(key[0] + 0.5 - center[0], key[1] + 0.5 - center[1])) for key in keys}
+        self.wanted = frozenset(keys)
+        for key in sorted(keys, key=distances.get):
+            if key in self.resident:
+                self.resident.move_to_end(key)
+            elif key not in self.pending:
+                self.pending.add(key)
+                self.requests.put((distances[key], key))
+
+        for _ in range(self.uploads):
+            try:
+                key, payload = self.results.get_nowait()
+            except queue.Empty:
+                break
+            self.pending.discard(key)
+            if payload is not None:
+                attributes, low, high, errors = payload
+                vertex_array = VertexArray(attributes)
+                self.indices.attach(vertex_array)
+                self.resident[key] = (vertex_array, low, high, errors)
+
+        while len(self.resident) > self.capacity:
+            self.resident.popitem(last=False)[1][0].release()
+        return first, last
+
+    def draw(self, projection, view, model, primitives=GL.GL_TRIANGLES):
+        eye = np.linalg.inv(view @ model)[:3, 3]
+        first, last = self.update(eye)
+        self.triangles = 0
+        keys = [key for key in self.resident if key in self.wanted]
+        if not keys:
+            return
+
+        tiles = [self.resident[key] for key in keys]
+        lows, highs = np.array([tile[1] for tile in tiles]), np.array([tile[2] for tile in tiles])
+        errors = np.array([tile[3] for tile in tiles])
+        viewport_height = state.get_viewport()[3]  # cached, see Viewer.on_resize
+        scale = projection[1, 1] * viewport_height / 2
+
+        # levels on the window of wanted tiles, missing ones at the coarsest
+        coarsest = self.indices.lods - 1
+        lods = np.full(last - first, coarsest)
+        window = np.array(keys) - first
+        lods[window[:, 0], window[:, 1]] = screen_lods(errors, lows, highs, eye, scale, self.tolerance)
+        lods = balance_lods(lods, coarsest)
+        masks = stitch_masks(lods)
+
+        state.use_program(self.shader.glid)
+        self.shader.set('model', model)
+
+        visible = boxes_in_frustum(frustum_planes(projection @ view @ model), lows, highs)
+        for (row, col), tile, inside in zip(window, tiles, visible):
+            if inside:
+                self.triangles += self.indices.draw(tile[0], lods[row, col], masks[row, col], primitives)
+
+    def close(self):
+        """ stop the background thread, after the tile it is building;
+            called by resources.shutdown() """
+        self.requests.put((-1.0, None))
+        self.worker.join()
+
+    def submit(self, queue, model):
+        queue.add_drawable(self, model)
+
+    def key_handler(self, key):
+        return
+
+
+def groundNode(viewer, shader, heightmapFile=HEIGHTMAP):
+    """ terrain of an image heightmap, or streamed from a .raw heightmap """
+    mainNode = Node(transform=translate(ORIGIN[0], 0, ORIGIN[1]) @ rotate((1, 0, 0), 0))
+    if heightmapFile.lower().endswith('.raw'):
+        mainNode.add(StreamingTerrain(shader, load_heightfield(heightmapFile)))
+    else:
+        mainNode.add(Terrain(shader, heightmapFile=heightmapFile))
+    viewer.add(mainNode)
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from keyframe import KeyFrames, KeyFramesBatch, TransformKeyFrames, TransformKeyFramesBatch
+from transform import quaternion_from_axis_angle, quaternion_slerp, quaternion_slerp_batch
+
+TIMES = np.arange(-1, 11, 0.25)  # before, on, between and after the keys
+
+
+def random_keys(rng, length):
+    return np.sort(rng.choice(np.arange(0, 10, 0.5), length, replace=False))
+
+
+@pytest.mark.parametrize('lengths', [[1, 1, 1], [1], [1, 2, 5, 3, 1], [2, 2]])
+def test_keyframes_batch_matches_keyframes(lengths):
+    rng = np.random.default_rng(len(lengths))
+    keyframes = [KeyFrames({time: rng.normal(size=3) for time in random_keys(rng, length)})
+                 for length in lengths]
+    batch = KeyFramesBatch(keyframes, 3)
+    for time in TIMES:
+        expected = [keys.value(time) for keys in keyframes]
+        np.testing.assert_allclose(batch.value(np.full(len(lengths), time)), expected, atol=1e-6)
+
+
+@pytest.mark.parametrize('lengths', [[1, 1], [1, 4, 2]])
+def test_rotation_keyframes_batch_matches_keyframes(lengths):
+    rng = np.random.default_rng(7)
+    keyframes = [KeyFrames({time: quaternion_from_axis_angle(rng.normal(size=3), rng.uniform(0, 180))
+                            for time in random_keys(rng, length)}, interpolation_function=quaternion_slerp)
+                 for length in lengths]
+    batch = KeyFramesBatch(keyframes, 4, interpolation_function=quaternion_slerp_batch)
+    for time in TIMES:
+        expected = [keys.value(time) for keys in keyframes]
+        np.testing.assert_allclose(batch.value(np.full(len(lengths), time)), expected, atol=1e-6)
+
+
+def test_transform_keyframes_batch_single_key_channels():
+    """ a rig whose translate and scale tracks all have a single key """
+    rng = np.random.default_rng(3)
+    keyframes = [TransformKeyFrames({0: rng.normal(size=3)},
+                                    {time: quaternion_from_axis_angle(rng.normal(size=3), rng.uniform(0, 180))
+                                     for time in random_keys(rng, 3)},
+                                    {0: float(rng.uniform(.5, 2))})
+                 for _ in range(4)]
+    batch = TransformKeyFramesBatch(keyframes)
+    for time in TIMES:
+        expected = [keys.value(time) for keys in keyframes]
+        np.testing.assert_allclose(batch.value(np.full(len(keyframes), time)), expected, atol=1e-5)
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from skinning import MAX_BONES, MAX_VERTEX_BONES, pack_bone_weights
+
+
+def reference_pack(vertex_ids, bone_ids, weights, num_vertices):
+    """ the packing of the assimp loader before pack_bone_weights: a
+        (num_vertices, MAX_BONES) structured array sorted by weight """
+    vbone = np.array([[(0, 0)] * MAX_BONES] * num_vertices, dtype=[('weight', 'f4'), ('id', 'u4')])
+    for vertex_id, bone_id, weight in zip(vertex_ids, bone_ids, weights):
+        vbone[vertex_id][bone_id] = (weight, bone_id)
+    vbone.sort(order='weight')
+    vbone = vbone[:, -MAX_VERTEX_BONES:]
+    return np.ascontiguousarray(vbone['id']), np.ascontiguousarray(vbone['weight'])
+
+
+def random_triples(rng, num_vertices, num_bones, max_influences):
+    """ (vertex, bone, weight) triples, 0 to max_influences distinct bones
+        per vertex, in random order as assimp lists them per bone """
+    triples = []
+    for vertex_id in range(num_vertices):
+        count = rng.integers(0, max_influences + 1)
+        for bone_id in rng.choice(num_bones, count, replace=False):
+            triples.append((vertex_id, bone_id, rng.uniform(0.01, 1)))
+    rng.shuffle(triples)
+    vertex_ids, bone_ids, weights = zip(*triples)
+    return np.array(vertex_ids), np.array(bone_ids), np.array(weights, np.float32)
+
+
+@pytest.mark.parametrize('num_vertices, num_bones, max_influences', [(200, 8, 3), (300, 40, 9), (100, 128, 20)])
+def test_pack_bone_weights_matches_reference(num_vertices, num_bones, max_influences):
+    rng = np.random.default_rng(num_vertices)
+    triples = random_triples(rng, num_vertices, num_bones, max_influences)
+    counts = np.bincount(triples[0], minlength=num_vertices)
+    assert (counts < MAX_VERTEX_BONES).any()
+    if max_influences > MAX_VERTEX_BONES:
+        assert (counts > MAX_VERTEX_BONES).any()
+
+    ids, weights = pack_bone_weights(*triples, num_vertices)
+    expected_ids, expected_weights = reference_pack(*triples, num_vertices)
+    np.testing.assert_array_equal(ids, expected_ids)
+
+    total = expected_weights.sum(axis=1, keepdims=True)
+    expected_weights = np.divide(expected_weights, total, out=np.zeros_like(expected_weights), where=total > 0)
+    np.testing.assert_allclose(weights, expected_weights, rtol=1e-6, atol=1e-7)
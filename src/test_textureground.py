@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from textureground import TextureGround
+from transform import normalized
+
+
+def reference_height(x, z, image):
+    """ TextureGround.get_height of the nested loops, 0 outside the map """
+    if x < 0 or x >= image.shape[0] or z < 0 or z >= image.shape[0]:
+        return 0
+    return (image[x, z, 0] / 256) * 100
+
+
+def reference_attributes(size, image):
+    """ the nested loops create_attributes replaced: one vertex, normal and
+        texture coordinate, then one grid cell, at a time """
+    vertices, normals, uvs = [], [], []
+    for i in range(size):
+        for j in range(size):
+            vertices.append([(j / (size - 1)) * 1000, reference_height(i, j, image), (i / (size - 1)) * 1000])
+            normals.append(normalized(np.array([reference_height(j - 1, i, image) - reference_height(j + 1, i, image),
+                                                2.0,
+                                                reference_height(j, i - 1, image) - reference_height(j, i + 1, image)])))
+            uvs.append([j / (size - 1), i / (size - 1)])
+
+    indices = []
+    for gz in range(size - 1):
+        for gx in range(size - 1):
+            top_left = gz * size + gx
+            bottom_left = (gz + 1) * size + gx
+            indices.append([top_left, bottom_left, top_left + 1, top_left + 1, bottom_left, bottom_left + 1])
+    return np.array(vertices), np.array(uvs), np.array(normals), np.array(indices)
+
+
+@pytest.mark.parametrize('size', [2, 17, 40])
+def test_create_attributes_matches_reference(size):
+    image = np.random.default_rng(size).integers(0, 256, (size, size, 3), np.uint8)
+    vertices, uvs, normals, indices = TextureGround.create_attributes(size, image)
+    expected = reference_attributes(size, image)
+
+    np.testing.assert_array_equal(vertices, expected[0].astype(np.float32))
+    np.testing.assert_array_equal(uvs, expected[1].astype(np.float32))
+    np.testing.assert_allclose(normals, expected[2], atol=1e-6)
+    np.testing.assert_array_equal(indices, expected[3])
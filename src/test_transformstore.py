@@ -0,0 +1,36 @@
+import numpy as np
+
+import skinning
+from skinning import SkinningControlNode
+from transform import quaternion, vec
+from transformstore import TransformStore
+
+
+def skeleton(depth, keys):
+    """ chain of depth SkinningControlNodes, all animated by keys """
+    node = SkinningControlNode(*keys)
+    if depth > 1:
+        node.add(skeleton(depth - 1, keys))
+    return node
+
+
+def test_submit_runs_animators_once(monkeypatch):
+    monkeypatch.setattr(skinning.glfw, 'get_time', lambda: 0.5)
+    keys = ({0: vec(0, 0, 0), 1: vec(1, 0, 0)}, {0: quaternion(), 1: quaternion()}, {0: 1, 1: 2})
+    root = skeleton(4, keys)
+    store = root.store = TransformStore(root)
+
+    calls = []
+    store.animators = [lambda animate=animate: calls.append(animate()) for animate in store.animators]
+    assert len(store.animators) == 1  # the whole skeleton in one batch
+
+    for frame in range(3):
+        root.submit(None, np.identity(4, 'f'))
+        assert len(calls) == frame + 1
+    root.draw(None, None, np.identity(4, 'f'))
+    assert len(calls) == 4
+
+    expected = np.identity(4)
+    for node in store.nodes:
+        expected = expected @ node.keyframes.value(0.5)
+        assert np.allclose(node.world_transform, expected, atol=1e-6)
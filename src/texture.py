@@ -1,29 +1,156 @@
+import os
+import tempfile
+from collections import OrderedDict
+
 import OpenGL.GL as GL
 import numpy as np
 from PIL import Image
 
+from bcn import compress_file
+from diskcache import CACHE_DIR, stat_hash
+from glresources import resources
+from glstate import state
+
+MIP_MAGIC = 0x3150494d  # 'MIP1': header is magic, width, height, levels
+
+
+def load_image(tex_file):
+    """ imports image as a numpy array in exactly right format, no GL call
+        so that decoding can happen in any thread """
+    return np.asarray(Image.open(tex_file).convert('RGBA'))
+
+
+def mip_chain(image):
+    """ all mipmap levels of a RGBA image down to 1x1, 2x2 box filtered """
+    levels = [np.ascontiguousarray(image, np.uint8)]
+    while levels[-1].shape[0] > 1 or levels[-1].shape[1] > 1:
+        tex = levels[-1].astype(np.uint16)
+        for axis in (0, 1):
+            half = tex.shape[axis] // 2
+            if half:
+                tex = tex.take(range(0, 2 * half, 2), axis) + tex.take(range(1, 2 * half, 2), axis)
+            else:  # this dimension already reached 1
+                tex = tex * 2
+        levels.append(((tex + 2) // 4).astype(np.uint8))
+    return levels
+
+
+def cook_texture(tex_file):
+    """ decode tex_file once and store its whole mip chain as raw RGBA in the
+        cache directory, returns the path of the cooked file """
+    path = os.path.join(CACHE_DIR, 'tex-%s.mip' % stat_hash(tex_file))
+    if not os.path.exists(path):
+        levels = mip_chain(load_image(tex_file))
+        header = np.array([MIP_MAGIC, levels[0].shape[1], levels[0].shape[0], len(levels)], '<u4')
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=CACHE_DIR, delete=False) as stream:
+            stream.write(header.tobytes())
+            for level in levels:
+                stream.write(level.tobytes())
+        os.replace(stream.name, path)
+    return path
+
+
+def load_mip_chain(tex_file):
+    """ mip chain of tex_file memory mapped from its cooked file, cooking it
+        on first use; no GL call so that it can run in any thread """
+    data = np.memmap(cook_texture(tex_file), np.uint8, mode='r')
+    magic, width, height, count = (int(value) for value in data[:16].view('<u4'))
+    assert magic == MIP_MAGIC, 'Corrupted cooked texture for %s' % tex_file
+    levels, offset = [], 16
+    for _ in range(count):
+        size = height * width * 4
+        levels.append(data[offset:offset + size].reshape(height, width, 4))
+        offset += size
+        width, height = max(1, width // 2), max(1, height // 2)
+    return levels
+
 
 class Texture:
     """ Helper class to create and automatically destroy textures """
 
     def __init__(self, tex_file, wrap_mode=GL.GL_REPEAT, min_filter=GL.GL_LINEAR,
-                 mag_filter=GL.GL_LINEAR_MIPMAP_LINEAR):
+                 mag_filter=GL.GL_LINEAR_MIPMAP_LINEAR, levels=None, compression=None):
+        """ levels: mip chain of tex_file from load_mip_chain, if already
+            mapped; each level is uploaded as is, without decoding.
+            compression: None for raw RGBA, else BC1/BC3 encoder quality """
         self.glid = GL.glGenTextures(1)
+        self.key = resources.track('texture', self.glid, self, label=tex_file)
+        self.nbytes = 0  # GPU memory held, mip chain included
         try:
-            # imports image as a numpy array in exactly right format
-            tex = np.asarray(Image.open(tex_file).convert('RGBA'))
-            GL.glBindTexture(GL.GL_TEXTURE_2D, self.glid)
-            GL.glTexImage2D(GL.GL_TEXTURE_2D, 0, GL.GL_RGBA, tex.shape[1],
-                            tex.shape[0], 0, GL.GL_RGBA, GL.GL_UNSIGNED_BYTE, tex)
+            state.bind_texture(GL.GL_TEXTURE_2D, self.glid)
+            if compression:  # encoded on first use, then mapped from its .bcn file
+                source = levels
+                fmt, levels = compress_file(tex_file, lambda: source or load_mip_chain(tex_file), compression)
+                for level, (width, height, data) in enumerate(levels):
+                    GL.glCompressedTexImage2D(GL.GL_TEXTURE_2D, level, fmt, width, height, 0, data)
+                    self.nbytes += data.nbytes
+            else:
+                levels = load_mip_chain(tex_file) if levels is None else levels
+                for level, tex in enumerate(levels):
+                    GL.glTexImage2D(GL.GL_TEXTURE_2D, level, GL.GL_RGBA, tex.shape[1],
+                                    tex.shape[0], 0, GL.GL_RGBA, GL.GL_UNSIGNED_BYTE, tex)
+                    self.nbytes += tex.nbytes
+            resources.resize(self.key, self.nbytes)
+            GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MAX_LEVEL, len(levels) - 1)
             GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_WRAP_S, wrap_mode)
             GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_WRAP_T, wrap_mode)
             GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MAG_FILTER, min_filter)
             GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MIN_FILTER, mag_filter)
-            GL.glGenerateMipmap(GL.GL_TEXTURE_2D)
             # message = 'Loaded texture %s\t(%s, %s, %s, %s)'
             # print(message % (tex_file, tex.shape, wrap_mode, min_filter, mag_filter))
         except FileNotFoundError:
             print("ERROR: unable to load texture file %s" % tex_file)
 
-    def __del__(self):  # delete GL texture from GPU when object dies
-        GL.glDeleteTextures(self.glid)
+    def release(self):  # delete GL texture from GPU at the end of the frame
+        resources.release(self.key)
+
+
+# ------------  Shared textures with reference counting and memory budget ---
+class TextureManager:
+    """ Shares one GL texture per (file, sampler parameters). Textures are
+        reference counted: released ones stay resident for later reuse until
+        the budget in bytes is exceeded, the least recently used being
+        evicted first. Referenced textures are never evicted. """
+
+    def __init__(self, budget=512 << 20):
+        self.budget = budget
+        self.entries = OrderedDict()  # key -> [texture, references], LRU first
+        self.keys = {}  # texture glid -> key
+
+    def acquire(self, tex_file, wrap_mode=GL.GL_REPEAT, min_filter=GL.GL_LINEAR,
+                mag_filter=GL.GL_LINEAR_MIPMAP_LINEAR, levels=None, compression=None):
+        """ shared texture for tex_file, its reference count is incremented """
+        key = (os.path.normcase(os.path.abspath(tex_file)), wrap_mode, min_filter, mag_filter, compression)
+        if key not in self.entries:
+            texture = Texture(tex_file, wrap_mode, min_filter, mag_filter, levels, compression)
+            self.entries[key] = [texture, 0]
+            self.keys[texture.glid] = key
+        self.entries.move_to_end(key)
+        self.entries[key][1] += 1
+        self.evict()
+        return self.entries[key][0]
+
+    def release(self, texture):
+        """ drop one reference to texture, making it evictable at zero """
+        entry = self.entries[self.keys[texture.glid]]
+        entry[1] -= 1
+        self.evict()
+
+    def evict(self):
+        """ free least recently used unreferenced textures while over budget """
+        resident = self.resident_bytes()
+        for key, (texture, references) in list(self.entries.items()):
+            if resident <= self.budget:
+                break
+            if references <= 0:
+                del self.entries[key], self.keys[texture.glid]
+                texture.release()
+                resident -= texture.nbytes
+
+    def resident_bytes(self):
+        """ GPU memory held by all managed textures """
+        return sum(texture.nbytes for texture, _ in self.entries.values())
+
+
+textures = TextureManager()
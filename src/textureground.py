@@ -1,51 +1,61 @@
 import numpy as np
-from PIL import Image
-from transform import normalized
+from heightfield import load_heightfield
 from node import Node
 from mesh import Mesh
-from transform import rotate, translate
 
 
 class TextureGround(Mesh, Node):
 
 	def __init__(self, shader, heightmapFile):
-		heightmapTexture = np.asarray(Image.open(heightmapFile).convert('RGB'))
+		heightmapTexture = load_heightfield(heightmapFile).image
 		vertices, textureCoordinates, normals, indices = self.create_attributes(heightmapTexture.shape[0],
 		                                                                        heightmapTexture)
 		super().__init__(shader, [vertices, textureCoordinates, normals], indices)
 
-	def create_attributes(self, size, heightmapTexture):
-		vertices = []
-		normals = []
-		textureCoordinates = []
+	@classmethod
+	def create_attributes(cls, size, heightmapTexture):
+		""" grid geometry built with whole array operations, directly in the
+			float32 and int32 formats VertexArray uploads """
+		channel = heightmapTexture[:size, :size]
+		steps = np.arange(size) / (size - 1)  # vertex (i, j) at row i, column j
 
-		for i in range(0, size):
-			for j in range(0, size):
-				vertices.append(
-					[(j / (size - 1)) * 1000, self.get_height(i, j, heightmapTexture), (i / (size - 1)) * 1000])
-				normals.append(self.calculateNormal(j, i, heightmapTexture))
-				textureCoordinates.append([j / (size - 1), i / (size - 1)])
+		vertices = np.empty((size, size, 3), np.float32)
+		vertices[:, :, 0] = steps * 1000
+		vertices[:, :, 1] = cls.get_heights(channel)
+		vertices[:, :, 2] = steps[:, None] * 1000
 
-		vertices = np.array(vertices)
-		normals = np.array(normals)
-		textureCoordinates = np.array(textureCoordinates)
+		textureCoordinates = np.empty((size, size, 2), np.float32)
+		textureCoordinates[:, :, 0] = steps
+		textureCoordinates[:, :, 1] = steps[:, None]
 
-		indices = []
-		for gz in range(0, size - 1):
-			for gx in range(0, size - 1):
-				top_left = (gz * size) + gx
-				top_right = top_left + 1
-				bottom_left = ((gz + 1) * size) + gx
-				bottom_right = bottom_left + 1
-				indices.append([top_left, bottom_left, top_right, top_right, bottom_left, bottom_right])
+		# central differences, heights outside the map being 0; the normal of
+		# vertex (i, j) is taken at texel (j, i), hence the transposed heights
+		padded = np.zeros((size + 2, size + 2))
+		padded[1:-1, 1:-1] = cls.get_heights(channel.transpose(1, 0, 2))
+		dx = padded[1:-1, :-2] - padded[1:-1, 2:]
+		dz = padded[:-2, 1:-1] - padded[2:, 1:-1]
+		norm = dx * dx
+		norm += 2.0 * 2.0
+		norm += dz * dz
+		np.sqrt(norm, out=norm)
+		normals = np.empty((size, size, 3), np.float32)
+		np.divide(dx, norm, out=normals[:, :, 0], casting='unsafe')
+		np.divide(2.0, norm, out=normals[:, :, 1], casting='unsafe')
+		np.divide(dz, norm, out=normals[:, :, 2], casting='unsafe')
 
-		indices = np.array(indices)
+		# two triangles per grid cell: index template of a row of cells,
+		# shifted by one grid row for each of the others
+		cells = np.arange(size - 1, dtype=np.int32)
+		row = (cells[:, None] + np.array([0, size, 1, 1, size, size + 1], np.int32)).reshape(-1)
+		indices = (cells[:, None] * size + row).reshape(-1, 6)
 
-		return vertices, textureCoordinates, normals, indices
+		return (vertices.reshape(-1, 3), textureCoordinates.reshape(-1, 2),
+				normals.reshape(-1, 3), indices)
 
-	def calculateNormal(self, x, z, hmap_image):
-		return normalized(np.array([self.get_height(x - 1, z, hmap_image) - self.get_height(x + 1, z, hmap_image), 2.0,
-		                            self.get_height(x, z - 1, hmap_image) - self.get_height(x, z + 1, hmap_image)]))
+	@staticmethod
+	def get_heights(image):
+		""" height of every texel of the heightmap, see get_height """
+		return (image[:, :, 0] / 256) * 100
 
 	def get_height(self, x, z, image):
 		if x < 0 or x >= image.shape[0] or z < 0 or z >= image.shape[0]:
@@ -56,8 +66,3 @@ class TextureGround(Mesh, Node):
 	def key_handler(self, key):
 		return
 
-
-def groundNode(viewer, shader):
-	mainNode = Node(transform=translate(-300, 0, -300) @ rotate((1, 0, 0), 0))
-	mainNode.add(TextureGround(shader, heightmapFile="../resources/hmap.png"))
-	viewer.add(mainNode)
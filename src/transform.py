@@ -25,7 +25,7 @@ def vec(*iterable):
 
 def normalized(vector):
 	""" normalized version of any vector, with zero division check """
-	norm = math.sqrt(sum(vector * vector))
+	norm = math.sqrt(np.dot(vector, vector))
 	return vector / norm if norm > 0. else vector
 
 
@@ -119,6 +119,24 @@ def lookat(eye, target, up):
 	return rotation @ translate(-eye)
 
 
+# frustum culling functions --------------------------------------------------
+def frustum_planes(matrix):
+	""" 6 normalized planes (a, b, c, d) bounding the frustum of a clip
+		matrix, e.g. projection @ view @ model, in the space it maps from:
+		a point p is inside if a*x + b*y + c*z + d >= 0 for all of them """
+	m = np.asarray(matrix, np.float64)
+	planes = np.array([m[3] + m[0], m[3] - m[0], m[3] + m[1], m[3] - m[1], m[3] + m[2], m[3] - m[2]])
+	return planes / np.linalg.norm(planes[:, :3], axis=1, keepdims=True)
+
+
+def boxes_in_frustum(planes, lows, highs):
+	""" mask of the (N, 3) axis aligned boxes lows..highs which are not
+		entirely behind one of the planes, conservative """
+	# corner of each box furthest along each plane normal
+	corners = np.where(planes[:, :3] > 0, highs[:, None, :], lows[:, None, :])
+	return ((corners * planes[:, :3]).sum(axis=2) + planes[:, 3] >= 0).all(axis=1)
+
+
 # quaternion functions -------------------------------------------------------
 def quaternion(x=vec(0., 0., 0.), y=0.0, z=0.0, w=1.0):
 	""" Init quaternion, w=real and, x,y,z or vector x imaginary components """
@@ -178,6 +196,99 @@ def quaternion_slerp(q0, q1, fraction):
 	return q0 * math.cos(theta) + q2 * math.sin(theta)
 
 
+def quaternion_nlerp(q0, q1, fraction):
+	""" Normalized linear interpolation of two quaternions, a cheaper slerp
+		of non constant angular speed, along the shorter path """
+	q0, q1 = normalized(q0), normalized(q1)
+	q1 = q1 if np.dot(q0, q1) > 0 else -q1
+	return normalized(lerp(q0, q1, fraction))
+
+
+# batched functions ----------------------------------------------------------
+# Same results as the functions above for N vectors, quaternions or matrices
+# at once: (N, 3) vectors, (N, 4) quaternions, (N,) or scalar fractions and
+# (N, 4, 4) float32 matrices. Results are written to out if given, e.g. rows
+# of a TransformStore, otherwise to new arrays.
+def _output(out, shape):
+	return np.empty(shape, 'f') if out is None else out
+
+
+def normalized_batch(vectors, out=None):
+	""" normalized rows of vectors, zero rows left unchanged """
+	vectors = np.asarray(vectors, 'f')
+	norms = np.sqrt(np.einsum('ij,ij->i', vectors, vectors))[:, None]
+	out = _output(out, vectors.shape)
+	out[:] = vectors
+	return np.divide(out, norms, out=out, where=norms > 0)
+
+
+def translate_batch(translations, out=None):
+	""" (N, 4, 4) translation matrices of (N, 3) vectors """
+	translations = np.asarray(translations, 'f')
+	out = _output(out, (len(translations), 4, 4))
+	out[:] = np.identity(4, 'f')
+	out[:, :3, 3] = translations
+	return out
+
+
+def scale_batch(scales, out=None):
+	""" (N, 4, 4) scale matrices of (N, 3) factors, or (N,) uniform ones """
+	scales = np.asarray(scales, 'f')
+	out = _output(out, (len(scales), 4, 4))
+	out[:] = 0
+	diagonal = np.einsum('nii->ni', out)  # writable view of the diagonals
+	diagonal[:, :3] = scales.reshape(len(scales), -1)
+	diagonal[:, 3] = 1
+	return out
+
+
+def quaternion_matrix_batch(quaternions, out=None):
+	""" (N, 4, 4) rotation matrices of (N, 4) quaternions """
+	w, x, y, z = normalized_batch(quaternions).T
+	out = _output(out, (len(w), 4, 4))
+	nxx, nyy, nzz = -x * x, -y * y, -z * z
+	qwx, qwy, qwz = w * x, w * y, w * z
+	qxy, qxz, qyz = x * y, x * z, y * z
+	out[:, 0, 0], out[:, 0, 1], out[:, 0, 2] = 2 * (nyy + nzz) + 1, 2 * (qxy - qwz), 2 * (qxz + qwy)
+	out[:, 1, 0], out[:, 1, 1], out[:, 1, 2] = 2 * (qxy + qwz), 2 * (nxx + nzz) + 1, 2 * (qyz - qwx)
+	out[:, 2, 0], out[:, 2, 1], out[:, 2, 2] = 2 * (qxz - qwy), 2 * (qyz + qwx), 2 * (nxx + nyy) + 1
+	out[:, :3, 3] = out[:, 3, :3] = 0
+	out[:, 3, 3] = 1
+	return out
+
+
+def quaternion_slerp_batch(q0, q1, fractions, out=None):
+	""" quaternion_slerp of the (N, 4) rows of q0 and q1 """
+	q0, q1 = normalized_batch(q0), normalized_batch(q1)
+	dot = np.einsum('ij,ij->i', q0, q1)
+	flip = dot <= 0  # shorter path, as quaternion_slerp
+	q1[flip] *= -1
+	dot[flip] *= -1
+	theta = np.arccos(np.clip(dot, -1, 1)) * fractions
+	q2 = normalized_batch(q1 - q0 * dot[:, None])
+	out = _output(out, q0.shape)
+	np.multiply(q0, np.cos(theta)[:, None], out=out)
+	out += q2 * np.sin(theta)[:, None]
+	return out
+
+
+def quaternion_nlerp_batch(q0, q1, fractions, out=None):
+	""" quaternion_nlerp of the (N, 4) rows of q0 and q1 """
+	q0, q1 = normalized_batch(q0), normalized_batch(q1)
+	q1[np.einsum('ij,ij->i', q0, q1) <= 0] *= -1
+	lerped = q0 + np.reshape(fractions, (-1, 1)) * (q1 - q0)
+	return normalized_batch(lerped, out)
+
+
+def trs_batch(translations, quaternions, scales, out=None):
+	""" (N, 4, 4) stack of translate(t) @ quaternion_matrix(q) @ scale(s),
+		scales (N, 3) or (N,) uniform, composed without matrix products """
+	out = quaternion_matrix_batch(quaternions, out)
+	out[:, :3, :3] *= np.asarray(scales, 'f').reshape(len(out), 1, -1)  # scale columns
+	out[:, :3, 3] = translations
+	return out
+
+
 # a trackball class based on provided quaternion functions -------------------
 class Trackball:
 	"""Virtual trackball for 3D scene viewing. Independent of window system."""
@@ -0,0 +1,58 @@
+import numpy as np
+
+
+# ------------  Transform hierarchy as flat arrays, updated level by level ---
+class TransformStore:
+    """ The transforms of a Node subtree as arrays: parent row, local and
+        world matrix per row, in breadth first order so that each depth
+        level is a contiguous range of rows. update() computes the world
+        matrices of a whole level with one batched np.matmul, parents
+        before children, instead of one Python product per node.
+
+        Attached nodes read and write their row: their transform is a view
+        of the local matrices, their world_transform one of the world
+        matrices. The root's Node.world updates the store; nodes with an
+        interpolate() method, e.g. animated ones, are asked to set their
+        transform just before. Classes with an interpolator(store, nodes)
+        class method instead set the rows of all their nodes at once, with
+        the function it returns. Nodes added to the subtree later are not
+        part of the store, and are drawn as plain nodes. """
+
+    def __init__(self, root):
+        self.nodes, self.parents, levels = [root], [-1], [0]
+        for row, node in enumerate(self.nodes):  # grows while walked: breadth first
+            for child in node.children:
+                if hasattr(child, 'world'):  # scene graph Node
+                    assert child.store is None, "node already in a transform store"
+                    self.nodes.append(child)
+                    self.parents.append(row)
+                    levels.append(levels[row] + 1)
+        self.parents = np.array(self.parents, np.intp)
+        self.levels = np.searchsorted(levels, np.arange(levels[-1] + 2))  # first row of each depth
+
+        self.local = np.array([node.transform for node in self.nodes], np.float32)
+        self.world = np.empty_like(self.local)
+        self.dirty, self.model = True, None
+        for row, node in enumerate(self.nodes):
+            node.store, node.row = self, row
+            node.world_transform = self.world[row]
+
+        # functions setting the local transforms of the animated rows
+        self.animators, batched = [], {}
+        for node in self.nodes:
+            if hasattr(node, 'interpolator'):
+                batched.setdefault(type(node), []).append(node)
+            elif hasattr(node, 'interpolate'):
+                self.animators.append(node.interpolate)
+        self.animators += [cls.interpolator(self, nodes) for cls, nodes in batched.items()]
+
+    def update(self, model):
+        """ world matrices of all rows, the root placed by model """
+        for animate in self.animators:
+            animate()
+        if not self.dirty and model is self.model:
+            return
+        np.matmul(model, self.local[0], out=self.world[0])
+        for first, end in zip(self.levels[1:-1], self.levels[2:]):
+            np.matmul(self.world[self.parents[first:end]], self.local[first:end], out=self.world[first:end])
+        self.dirty, self.model = False, model
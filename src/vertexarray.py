@@ -1,48 +1,238 @@
+import copy
+import ctypes
+
 import numpy as np
 import OpenGL.GL as GL
 
+from glresources import resources
+from glstate import state
+
+# GL type of the vertex fields of interleaved layouts, by (kind, size)
+GL_TYPES = {('f', 4): GL.GL_FLOAT, ('f', 2): GL.GL_HALF_FLOAT,
+            ('i', 1): GL.GL_BYTE, ('u', 1): GL.GL_UNSIGNED_BYTE,
+            ('i', 2): GL.GL_SHORT, ('u', 2): GL.GL_UNSIGNED_SHORT,
+            ('i', 4): GL.GL_INT, ('u', 4): GL.GL_UNSIGNED_INT}
+
+
+def integer(dtype):
+    """ dtype of a vertex field that shaders read as integers (ivec, uvec);
+        other integer fields are normalized to [0, 1] or [-1, 1] floats """
+    return np.dtype(dtype, metadata={'integer': True})
+
+
+# compact interleaved layouts of imported meshes, see pack_vertices
+PHONG_VERTEX = np.dtype([('position', '<f4', 3), ('uv', '<f2', 2), ('normal', '<i2', 4)])
+SKINNED_VERTEX = np.dtype(PHONG_VERTEX.descr + [('bone_ids', integer('u1'), 4), ('bone_weights', 'u1', 4)])
+
+
+def snorm16(values):
+    """ values in [-1, 1] as normalized int16 """
+    return np.rint(np.clip(values, -1, 1) * 32767).astype(np.int16)
+
+
+def unorm8_weights(weights):
+    """ rows of weights as normalized uint8 summing exactly to 255, the
+        rounding residue going to the largest weight of each row """
+    quantized = np.rint(np.clip(weights, 0, 1) * 255).astype(np.int32)
+    residue = np.where(quantized.sum(axis=1) > 0, 255 - quantized.sum(axis=1), 0)
+    quantized[np.arange(len(quantized)), quantized.argmax(axis=1)] += residue
+    return quantized.astype(np.uint8)
+
+
+def pack_vertices(vertices, uvs=None, normals=None, bone_ids=None, bone_weights=None):
+    """ interleaved PHONG_VERTEX, or SKINNED_VERTEX when bones are given """
+    layout = PHONG_VERTEX if bone_ids is None else SKINNED_VERTEX
+    packed = np.zeros(len(vertices), layout)
+    packed['position'] = vertices
+    if uvs is not None:
+        packed['uv'] = np.asarray(uvs)[:, :2]
+    if normals is not None:
+        packed['normal'][:, :3] = snorm16(normals)
+    if bone_ids is not None:
+        packed['bone_ids'] = bone_ids
+        packed['bone_weights'] = unorm8_weights(bone_weights)
+    return packed
+
 
 class VertexArray:
     """ helper class to create and self destroy OpenGL vertex array objects."""
 
-    def __init__(self, attributes, index=None, usage=GL.GL_STATIC_DRAW):
+    def __init__(self, attributes, index=None, usage=GL.GL_STATIC_DRAW, frames=1):
         """ Vertex array from attributes and optional index array. Vertex
-            Attributes should be list of arrays with one row per vertex. """
+            Attributes should be list of arrays with one row per vertex, or
+            a structured array of interleaved vertices, its fields in shader
+            layout order; see GL_TYPES for the supported field types.
+            Vertices are rewritten in place with update(), or with frames > 1
+            each buffer holds that many copies of them, a ring buffer which
+            stream() cycles through to upload new vertices every frame. """
 
         # create vertex array object, bind it
         self.glid = GL.glGenVertexArrays(1)
-        GL.glBindVertexArray(self.glid)
+        state.bind_vertex_array(self.glid)
+        self.keys = [resources.track('vertex array', self.glid, self)]
         self.buffers = []  # we will store buffers in a list
+        self.vertex_buffers = []  # (vbo, bytes per vertex) per attribute
+        self.frames, self.frame = frames, 0
+        self.layout = None
         nb_primitives, size = 0, 0
 
+        if getattr(attributes, 'dtype', None) is not None and attributes.dtype.names:
+            self.layout = attributes.dtype
+        attributes = self._buffer_data(attributes)
+
         # load buffer per vertex attribute (in list with index = shader layout)
         for loc, data in enumerate(attributes):
-            if data is not None:
-                # bind a new vbo, upload its data to GPU, declare size and type
-                self.buffers.append(GL.glGenBuffers(1))
-                data = np.array(data, np.float32, copy=False)  # ensure format
-                nb_primitives, size = data.shape
-                GL.glEnableVertexAttribArray(loc)
-                GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.buffers[-1])
+            if data is None:
+                self.vertex_buffers.append(None)
+                continue
+            # bind a new vbo, upload its data to GPU, declare size and type
+            self.buffers.append(GL.glGenBuffers(1))
+            self.keys.append(resources.track('buffer', self.buffers[-1], self, frames * data.nbytes, 'vertex buffer'))
+            self.vertex_buffers.append((self.buffers[-1], data.nbytes // max(len(data), 1)))
+            nb_primitives = len(data)
+            GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.buffers[-1])
+            if frames == 1:
                 GL.glBufferData(GL.GL_ARRAY_BUFFER, data, usage)
-                GL.glVertexAttribPointer(loc, size, GL.GL_FLOAT, False, 0, None)
+            else:
+                GL.glBufferData(GL.GL_ARRAY_BUFFER, frames * data.nbytes, None, usage)
+                GL.glBufferSubData(GL.GL_ARRAY_BUFFER, 0, data.nbytes, data)
+        self.capacity = nb_primitives  # vertices per copy
 
-        # optionally create and upload an index buffer for this object
-        self.draw_command = GL.glDrawArrays
+        # optionally create and upload an index buffer for this object,
+        # 16 bit when all vertices can be addressed with it
+        self.draw_command = GL.glDrawElements if index is not None else GL.glDrawArrays
         self.arguments = (0, nb_primitives)
+        self.index_buffer = self.index_dtype = None
         if index is not None:
             self.buffers += [GL.glGenBuffers(1)]
-            index_buffer = np.array(index, np.int32, copy=False)  # good format
+            self.index_buffer = self.buffers[-1]
+            short = nb_primitives <= 1 << 16
+            self.index_dtype = np.dtype(np.uint16 if short else np.uint32)
+            index_buffer = np.asarray(index, self.index_dtype)  # good format
             GL.glBindBuffer(GL.GL_ELEMENT_ARRAY_BUFFER, self.buffers[-1])
             GL.glBufferData(GL.GL_ELEMENT_ARRAY_BUFFER, index_buffer, usage)
-            self.draw_command = GL.glDrawElements
-            self.arguments = (index_buffer.size, GL.GL_UNSIGNED_INT, None)
+            self.keys.append(resources.track('buffer', self.buffers[-1], self, index_buffer.nbytes, 'index buffer'))
+            index_type = GL.GL_UNSIGNED_SHORT if short else GL.GL_UNSIGNED_INT
+            self.arguments = (index_buffer.size, index_type, None)
+            if frames > 1:  # indices address the copy drawn via base vertex
+                self.draw_command = GL.glDrawElementsBaseVertex
+                self.arguments += (0,)
+        self._attach()
+
+    def _attach(self):
+        """ declare the vertex buffers and index buffer in the bound
+            vertex array object, one pointer per attribute """
+        for loc, buffer in enumerate(self.vertex_buffers):
+            if buffer is None:
+                continue
+            vbo, stride = buffer
+            GL.glBindBuffer(GL.GL_ARRAY_BUFFER, vbo)
+            if self.layout is not None:
+                self._interleave(self.layout)
+            else:
+                GL.glEnableVertexAttribArray(loc)
+                GL.glVertexAttribPointer(loc, stride // 4, GL.GL_FLOAT, False, 0, None)
+        if self.index_buffer is not None:
+            GL.glBindBuffer(GL.GL_ELEMENT_ARRAY_BUFFER, self.index_buffer)
+
+    def share(self):
+        """ new vertex array object drawing the same buffers, e.g. to add
+            attributes of its own. It keeps this one, owner of the buffers,
+            alive, and draws its current vertices: not the later copies
+            written by stream(), which only updates this one's arguments """
+        shared = copy.copy(self)
+        shared.source = self
+        shared.glid = GL.glGenVertexArrays(1)
+        state.bind_vertex_array(shared.glid)
+        shared.keys = [resources.track('vertex array', shared.glid, shared)]
+        shared._attach()
+        return shared
+
+    def _buffer_data(self, attributes):
+        """ contiguous array uploaded to each vertex buffer, None if none """
+        if self.layout is not None:
+            return [np.ascontiguousarray(attributes, self.layout)]
+        return [None if data is None else np.ascontiguousarray(data, np.float32)  # ensure format
+                for data in attributes]
+
+    @staticmethod
+    def _interleave(layout):
+        """ one pointer per field of the interleaved vertices of bound vbo """
+        for loc, name in enumerate(layout.names):
+            field, offset = layout.fields[name][:2]
+            base, size = field.base, field.shape[0] if field.shape else 1
+            gl_type = GL_TYPES[base.kind, base.itemsize]
+            GL.glEnableVertexAttribArray(loc)
+            if (base.metadata or {}).get('integer'):
+                GL.glVertexAttribIPointer(loc, size, gl_type, layout.itemsize, ctypes.c_void_p(offset))
+            else:
+                GL.glVertexAttribPointer(loc, size, gl_type, base.kind in 'iu', layout.itemsize,
+                                         ctypes.c_void_p(offset))
+
+    def update(self, attributes, first=0):
+        """ overwrite the vertices from index first with glBufferSubData,
+            attributes as in the constructor, None to keep one unchanged """
+        assert self.frames == 1, "ring buffers are written with stream()"
+        for buffer, data in zip(self.vertex_buffers, self._buffer_data(attributes)):
+            if buffer is not None and data is not None:
+                assert first + len(data) <= self.capacity, "update past the end of the buffers"
+                vbo, stride = buffer
+                GL.glBindBuffer(GL.GL_ARRAY_BUFFER, vbo)
+                GL.glBufferSubData(GL.GL_ARRAY_BUFFER, first * stride, data.nbytes, data)
+
+    def update_index(self, index, first=0):
+        """ overwrite the indices from position first with glBufferSubData """
+        index = np.ascontiguousarray(index, self.index_dtype).ravel()
+        assert first + index.size <= self.arguments[0], "update past the end of the index buffer"
+        state.bind_vertex_array(self.glid)  # element buffer binding is vertex array state
+        GL.glBufferSubData(GL.GL_ELEMENT_ARRAY_BUFFER, first * index.itemsize, index.nbytes, index)
+
+    def stream(self, attributes):
+        """ write up to capacity new vertices, all attributes given, to the
+            next copy of the ring buffer and draw from it from now on.
+            Copies are mapped unsynchronized, never waiting on the GPU: the
+            storage is orphaned whenever the ring wraps around, so each
+            copy of a storage is written only once, before any draw reads it """
+        assert self.frames > 1, "only ring buffers are streamed"
+        self.frame = (self.frame + 1) % self.frames
+        invalidate = GL.GL_MAP_INVALIDATE_BUFFER_BIT if self.frame == 0 else GL.GL_MAP_INVALIDATE_RANGE_BIT
+        access = GL.GL_MAP_WRITE_BIT | GL.GL_MAP_UNSYNCHRONIZED_BIT | invalidate
+        count = 0
+        for buffer, data in zip(self.vertex_buffers, self._buffer_data(attributes)):
+            if buffer is None:
+                continue
+            vbo, stride = buffer
+            count = len(data)
+            assert count <= self.capacity, "more vertices than the ring buffer holds"
+            if count:
+                GL.glBindBuffer(GL.GL_ARRAY_BUFFER, vbo)
+                pointer = GL.glMapBufferRange(GL.GL_ARRAY_BUFFER, self.frame * self.capacity * stride,
+                                              data.nbytes, access)
+                ctypes.memmove(pointer, data.ctypes.data, data.nbytes)
+                GL.glUnmapBuffer(GL.GL_ARRAY_BUFFER)
+        first = self.frame * self.capacity
+        if self.draw_command is GL.glDrawArrays:
+            self.arguments = (first, count)
+        else:
+            self.arguments = self.arguments[:3] + (first,)
 
     def execute(self, primitive):
         """ draw a vertex array, either as direct array or indexed array """
-        GL.glBindVertexArray(self.glid)
+        state.bind_vertex_array(self.glid)
         self.draw_command(primitive, *self.arguments)
 
-    def __del__(self):  # object dies => kill GL array and buffers from GPU
-        GL.glDeleteVertexArrays(1, [self.glid])
-        GL.glDeleteBuffers(len(self.buffers), self.buffers)
+    def draw(self, primitive):
+        """ execute() when the vertex array is already bound """
+        self.draw_command(primitive, *self.arguments)
+
+    def draw_instanced(self, primitive, instances):
+        """ draw() of that many instances, see gl_InstanceID """
+        if self.draw_command is GL.glDrawArrays:
+            GL.glDrawArraysInstanced(primitive, *self.arguments, instances)
+        elif self.draw_command is GL.glDrawElements:
+            GL.glDrawElementsInstanced(primitive, *self.arguments, instances)
+        else:  # ring buffer copy at a base vertex
+            GL.glDrawElementsInstancedBaseVertex(primitive, *self.arguments[:3], instances, self.arguments[3])
+
+    def release(self):  # kill GL array and buffers from GPU at the end of the frame
+        resources.release(*self.keys)
@@ -4,6 +4,10 @@ import OpenGL.GL as GL
 from transform import identity, lookat, perspective
 from node import Node
 from camera import Camera
+from framedata import FrameData
+from glstate import state
+from renderqueue import RenderQueue
+from glresources import resources
 
 
 # ------------  Viewer class & window management ------------------------------
@@ -31,13 +35,24 @@ class Viewer(Node):
 
         # register event handlers
         glfw.set_key_callback(self.win, self.on_key)
-        glfw.set_window_size_callback(self.win, GL.glViewport(0, 0, *glfw.get_framebuffer_size(self.win)))
+        glfw.set_framebuffer_size_callback(self.win, self.on_resize)
 
         # initialize GL by setting viewport and default render characteristics
+        state.set_viewport(0, 0, *glfw.get_framebuffer_size(self.win))
         # GL.glClearColor(0.1, 0.1, 0.1, 0.1)
         GL.glClearColor(0.52, 0.8, 0.91, 0.2)
-        GL.glEnable(GL.GL_CULL_FACE)  # backface culling enabled (TP2)
-        GL.glEnable(GL.GL_DEPTH_TEST)  # depth test now enabled (TP2)
+        state.enable(GL.GL_CULL_FACE)  # backface culling enabled (TP2)
+        state.enable(GL.GL_DEPTH_TEST)  # depth test now enabled (TP2)
+        state.depth_func(GL.GL_LESS)
+
+        # camera and lights uniforms, shared by all shaders
+        self.frame_data = FrameData()
+        self.render_queue = RenderQueue()
+
+        # same root model matrix every frame: cached world transforms of
+        # static nodes stay valid, see Node.world
+        self.model = identity()
+        self.transform_counters = Node.counters()
 
     def run(self):
         """ Main render loop for this OpenGL window """
@@ -54,16 +69,32 @@ class Viewer(Node):
                           target=self.camera.get_cameraPos() + self.camera.get_cameraFront(),
                           up=self.camera.get_cameraUp())
             projection = perspective(fovy=45, aspect=(self.width / self.height), near=0.1, far=500.0)
-            self.draw(projection, view, identity())
+            self.frame_data.update(view, projection)
+            self.render_queue.begin(projection, view)
+            self.submit(self.render_queue, self.model)
+            self.render_queue.flush()
+            self.transform_counters = Node.counters()
 
             # flush render commands, and swap draw buffers
             glfw.swap_buffers(self.win)
 
+            # GL objects released during the frame are deleted now
+            resources.collect()
+
             # Poll for and process events
             glfw.poll_events()
 
             self.camera.processInput(window=self.win, deltaTime=delta_time)
 
+        # free the GPU memory while the context still exists
+        resources.shutdown()
+
+    def on_resize(self, _win, width, height):
+        """ viewport and aspect ratio follow the framebuffer size """
+        if width and height:  # not minimized
+            state.set_viewport(0, 0, width, height)
+            self.width, self.height = width, height
+
     def on_key(self, _win, key, _scancode, action, _mods):
         """ 'Q' or 'Escape' quits """
         if action == glfw.PRESS or action == glfw.REPEAT:
@@ -73,6 +104,11 @@ class Viewer(Node):
                 GL.glPolygonMode(GL.GL_FRONT_AND_BACK, next(self.fill_modes))
             if key == glfw.KEY_SPACE:
                 glfw.set_time(0)
+            if key == glfw.KEY_I:
+                print('Last frame: %(packets)d draws, %(program_switches)d program switches, '
+                      '%(texture_binds)d texture binds, %(vertex_array_binds)d vertex array binds, '
+                      '%(state_changes)d GL state calls' % self.render_queue.stats)
+                print('World transforms: %(multiplies)d computed, %(reused)d reused' % self.transform_counters)
 
             # call Node.key_handler which calls key_handlers for all drawables
             self.key_handler(key)